@@ -0,0 +1,115 @@
+"""Two-tier cache of answer analyses: an in-process LRU in front of MongoDB.
+
+The same question and answer are often analyzed again against the same resume
+and job description (page reloads, client retries, practising an answer
+twice). The key is the SHA-256 of everything that determines the feedback:
+the analysis prompt version, the model, the question, the normalized answer
+and the hashes of the resume and job description texts. Bump the prompt
+version whenever the prompt changes so old feedback is not served for it.
+
+Entries live for ANALYSIS_CACHE_TTL_SECONDS; MongoDB removes them through a
+TTL index on expires_at, and the in-process tier checks the same expiry.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import async_crud
+import metrics
+from extraction import normalize_text
+from lru import ExpiringLRU
+
+ANALYSIS_CACHE_MAX_SIZE = int(os.environ.get("ANALYSIS_CACHE_MAX_SIZE", 1000))
+# 0 disables both tiers.
+ANALYSIS_CACHE_TTL_SECONDS = float(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+
+
+def analysis_cache_key(prompt_version, model: str, question: str, answer: str, resume_text_sha256: str, job_description_text_sha256: str) -> str:
+    material = json.dumps([
+        prompt_version,
+        model,
+        normalize_text(question),
+        normalize_text(answer),
+        resume_text_sha256,
+        job_description_text_sha256,
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, max_size: int = ANALYSIS_CACHE_MAX_SIZE, ttl: float = ANALYSIS_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (feedback, generation latency), expiring on time.time().
+        self._entries = ExpiringLRU(
+            max_size, clock=time.time, size_gauge=metrics.gauge("analysis_cache_memory_size", "Analyses held in the in-process cache")
+        )
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hit_count = 0
+        self._memory_hits = metrics.counter("analysis_cache_memory_hits_total", "Analyses served from the in-process cache")
+        self._mongo_hits = metrics.counter("analysis_cache_mongo_hits_total", "Analyses served from the MongoDB cache")
+        self._misses = metrics.counter("analysis_cache_misses_total", "Analyses that needed a Gemini call")
+        self._hit_ratio = metrics.gauge("analysis_cache_hit_ratio", "Share of analyses served from either cache tier")
+        self._saved = metrics.counter("analysis_cache_saved_seconds_total", "Gemini latency avoided by cache hits")
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _count(self, hit: bool):
+        with self._lock:
+            self._lookups += 1
+            self._hit_count += hit
+            ratio = self._hit_count / self._lookups
+        self._hit_ratio.set(ratio)
+
+    def _remember(self, key: str, expires_at: float, feedback: str, latency: float):
+        self._entries.set(key, (feedback, latency), expires_at)
+
+    def _from_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._memory_hits.inc()
+        self._saved.inc(entry[1])
+        return entry[0]
+
+    async def get(self, key: str) -> Optional[str]:
+        """Cached feedback for ``key``, or None."""
+        if not self.enabled:
+            return None
+        feedback = self._from_memory(key)
+        if feedback is None:
+            cached = await async_crud.get_cached_analysis(key, datetime.utcnow())
+            if cached is not None:
+                feedback = cached["feedback"]
+                self._mongo_hits.inc()
+                self._saved.inc(cached.get("latency_seconds", 0))
+                expires_at = time.time() + (cached["expires_at"] - datetime.utcnow()).total_seconds()
+                self._remember(key, expires_at, feedback, cached.get("latency_seconds", 0))
+        if feedback is None:
+            self._misses.inc()
+        self._count(feedback is not None)
+        return feedback
+
+    async def put(self, key: str, feedback: str, latency: float):
+        """Store freshly generated feedback; ``latency`` is what a later hit saves."""
+        if not self.enabled:
+            return
+        now = datetime.utcnow()
+        await async_crud.put_cached_analysis({
+            "_id": key,
+            "feedback": feedback,
+            "latency_seconds": latency,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl),
+        })
+        self._remember(key, time.time() + self.ttl, feedback, latency)
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,354 @@
+"""Async repository layer on Motor, used by every endpoint.
+
+Endpoints use these so that MongoDB round trips never hold a threadpool slot.
+crud.py keeps the synchronous operations that scripts and benchmarks use; new
+operations only go here. Both modules share the same collections, projections
+and invariants (see the Blob CRUD notes in crud.py).
+"""
+import io
+from datetime import datetime, timedelta
+from typing import BinaryIO, List, Optional
+
+from bson import ObjectId
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from blobstore import get_blob_store
+from user_cache import user_cache
+from crud import (
+    UPLOAD_FILE_FIELDS,
+    UPLOAD_META_PROJECTION,
+    UPLOAD_QUESTIONS_PROJECTION,
+    _upload_text_projection,
+)
+from database import (
+    get_async_user_collection,
+    get_async_upload_collection,
+    get_async_blob_collection,
+    get_async_session_collection,
+    get_async_feedback_collection,
+    get_async_analysis_feedback_collection,
+    get_async_analysis_cache_collection,
+    User,
+    Upload,
+    Blob,
+    Session,
+    Feedback,
+    AnalysisFeedback
+)
+
+# User CRUD
+async def create_user(user: User):
+    user_collection = get_async_user_collection()
+    result = await user_collection.insert_one(user.dict(exclude={'id'}))
+    user_cache.invalidate(user.username)
+    print(f"DEBUG: Inserted user with id: {result.inserted_id}")
+    return str(result.inserted_id)
+
+async def get_user_by_username(username: str):
+    user_collection = get_async_user_collection()
+    return await user_collection.find_one({"username": username})
+
+async def get_user_by_email(email: str):
+    user_collection = get_async_user_collection()
+    return await user_collection.find_one({"email": email})
+
+async def update_user_password(user_id, hashed_password: str):
+    user_collection = get_async_user_collection()
+    user = await user_collection.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"password": hashed_password}},
+        projection={"username": 1},
+    )
+    if user is not None:
+        user_cache.invalidate(user["username"])
+
+# Session CRUD
+async def create_session(session: Session):
+    session_collection = get_async_session_collection()
+    result = await session_collection.insert_one(session.dict(exclude={'id'}))
+    return str(result.inserted_id)
+
+async def rotate_session(token_hash: str, now: datetime):
+    """Mark a live refresh token as used and return its session, or None."""
+    session_collection = get_async_session_collection()
+    return await session_collection.find_one_and_update(
+        {"token_hash": token_hash, "rotated_at": None, "revoked": False, "expires_at": {"$gt": now}},
+        {"$set": {"rotated_at": now}},
+    )
+
+async def get_session_by_token_hash(token_hash: str):
+    session_collection = get_async_session_collection()
+    return await session_collection.find_one({"token_hash": token_hash})
+
+async def revoke_session_family(family_id: str):
+    session_collection = get_async_session_collection()
+    await session_collection.update_many({"family_id": family_id}, {"$set": {"revoked": True}})
+
+async def revoke_user_sessions(user_id: str):
+    session_collection = get_async_session_collection()
+    await session_collection.update_many({"user_id": user_id}, {"$set": {"revoked": True}})
+
+# Upload CRUD
+async def create_upload(upload: Upload):
+    upload_collection = get_async_upload_collection()
+    result = await upload_collection.insert_one(upload.dict(exclude={'id'}))
+    print(f"DEBUG: Inserted upload with id: {result.inserted_id}")
+    return str(result.inserted_id)
+
+async def get_latest_upload_by_user_id(user_id: str):
+    upload_collection = get_async_upload_collection()
+    return await upload_collection.find_one({"user_id": user_id}, sort=[("_id", -1)])
+
+async def get_latest_upload_meta(user_id: str):
+    upload_collection = get_async_upload_collection()
+    return await upload_collection.find_one({"user_id": user_id}, projection=UPLOAD_META_PROJECTION, sort=[("_id", -1)])
+
+async def get_latest_upload_questions(user_id: str):
+    upload_collection = get_async_upload_collection()
+    return await upload_collection.find_one({"user_id": user_id}, projection=UPLOAD_QUESTIONS_PROJECTION, sort=[("_id", -1)])
+
+async def get_latest_upload_text(user_id: str, fields=UPLOAD_FILE_FIELDS):
+    upload_collection = get_async_upload_collection()
+    return await upload_collection.find_one({"user_id": user_id}, projection=_upload_text_projection(fields), sort=[("_id", -1)])
+
+async def get_upload_text(upload_id: str, fields=UPLOAD_FILE_FIELDS):
+    upload_collection = get_async_upload_collection()
+    return await upload_collection.find_one({"_id": ObjectId(upload_id)}, projection=_upload_text_projection(fields))
+
+async def get_inline_upload_file(upload_id: str, field: str) -> Optional[bytes]:
+    upload_collection = get_async_upload_collection()
+    upload = await upload_collection.find_one({"_id": ObjectId(upload_id)}, projection={field: 1})
+    return upload.get(field) if upload else None
+
+async def update_upload_questions(upload_id: str, questions: List[str]):
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one(
+        {"_id": ObjectId(upload_id)},
+        {
+            "$set": {"generated_questions": questions, "questions_status": "ready"},
+            "$unset": {"questions_lease": "", "questions_error": "", "questions_failed_at": "", "streamed_questions": ""},
+        },
+    )
+
+async def append_upload_question(upload_id: str, owner: str, question: str):
+    """Add one question to the running generation, if ``owner`` still holds its lease."""
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one(
+        {"_id": ObjectId(upload_id), "questions_lease.owner": owner},
+        {"$push": {"streamed_questions": question}},
+    )
+
+async def get_upload_questions_state(upload_id: str):
+    upload_collection = get_async_upload_collection()
+    return await upload_collection.find_one(
+        {"_id": ObjectId(upload_id)},
+        projection={
+            "generated_questions": 1,
+            "streamed_questions": 1,
+            "questions_attempts": 1,
+            "questions_status": 1,
+            "questions_error": 1,
+            "questions_failed_at": 1,
+            "questions_lease": 1,
+        },
+    )
+
+async def acquire_questions_lease(upload_id: str, owner: str, now: datetime, lease_seconds: float) -> bool:
+    """Claim the right to generate an upload's questions, unless they exist or another live lease holds it."""
+    upload_collection = get_async_upload_collection()
+    result = await upload_collection.update_one(
+        {
+            "_id": ObjectId(upload_id),
+            "$and": [
+                # [] was saved for an empty reply before that counted as a failure; regenerate those.
+                {"$or": [{"generated_questions": None}, {"generated_questions": {"$size": 0}}]},
+                {"$or": [{"questions_lease": None}, {"questions_lease.expires_at": {"$lte": now}}]},
+            ],
+        },
+        {
+            "$set": {
+                "questions_lease": {"owner": owner, "expires_at": now + timedelta(seconds=lease_seconds)},
+                "questions_status": "generating",
+                "streamed_questions": [],
+            },
+            "$inc": {"questions_attempts": 1},
+        },
+    )
+    return result.modified_count == 1
+
+async def mark_upload_questions_failed(upload_id: str, owner: str, error: str, failed_at: Optional[datetime]):
+    """Record a failed generation; ``failed_at`` None lets it be retried right away."""
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one(
+        {"_id": ObjectId(upload_id), "questions_lease.owner": owner},
+        {
+            "$set": {"questions_status": "failed", "questions_error": error, "questions_failed_at": failed_at},
+            "$unset": {"questions_lease": ""},
+        },
+    )
+
+async def update_upload_text(upload_id: str, field: str, encrypted_text: bytes, text_sha256: str):
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one(
+        {"_id": ObjectId(upload_id)},
+        {"$set": {f"{field}_text": encrypted_text, f"{field}_text_sha256": text_sha256}},
+    )
+
+async def acquire_context_summary_lease(upload_id: str, owner: str, key: str, now: datetime, lease_seconds: float) -> bool:
+    """Claim the right to summarize an upload's texts, unless the summary for ``key`` exists or another live lease holds it."""
+    upload_collection = get_async_upload_collection()
+    result = await upload_collection.update_one(
+        {
+            "_id": ObjectId(upload_id),
+            "context_summary_key": {"$ne": key},
+            "$or": [{"context_summary_lease": None}, {"context_summary_lease.expires_at": {"$lte": now}}],
+        },
+        {"$set": {"context_summary_lease": {"owner": owner, "expires_at": now + timedelta(seconds=lease_seconds)}}},
+    )
+    return result.modified_count == 1
+
+async def release_context_summary_lease(upload_id: str, owner: str):
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one(
+        {"_id": ObjectId(upload_id), "context_summary_lease.owner": owner},
+        {"$unset": {"context_summary_lease": ""}},
+    )
+
+async def update_upload_context_summary(upload_id: str, owner: str, encrypted_summary: bytes, key: str):
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one(
+        {"_id": ObjectId(upload_id), "context_summary_lease.owner": owner},
+        {"$set": {"context_summary": encrypted_summary, "context_summary_key": key}, "$unset": {"context_summary_lease": ""}},
+    )
+
+async def update_upload_context_cache(upload_id: str, handle: Optional[dict]):
+    upload_collection = get_async_upload_collection()
+    await upload_collection.update_one({"_id": ObjectId(upload_id)}, {"$set": {"context_cache": handle}})
+
+async def find_generated_questions(
+    resume_sha256: str,
+    job_description_sha256: str,
+    resume_text_sha256: Optional[str],
+    job_description_text_sha256: Optional[str],
+    experience: str,
+    yearsOfExperience: Optional[str],
+):
+    upload_collection = get_async_upload_collection()
+    upload = await upload_collection.find_one(
+        {
+            "resume_sha256": resume_sha256,
+            "job_description_sha256": job_description_sha256,
+            # The same file uploaded under another content type can have other text.
+            "resume_text_sha256": resume_text_sha256,
+            "job_description_text_sha256": job_description_text_sha256,
+            "experience": experience,
+            "yearsOfExperience": yearsOfExperience,
+            "generated_questions": {"$ne": None},
+        },
+        projection={"generated_questions": 1},
+    )
+    return upload["generated_questions"] if upload else None
+
+# Blob CRUD
+# Blob data goes through the (blocking) blob store in the threadpool; the
+# metadata and reference counting are native async.
+async def acquire_blob(sha256: str):
+    blob_collection = get_async_blob_collection()
+    return await blob_collection.find_one_and_update(
+        {"_id": sha256, "refcount": {"$gt": 0}},
+        {"$inc": {"refcount": 1}},
+        projection={"data": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def create_blob(blob: Blob):
+    blob_collection = get_async_blob_collection()
+    blob_dict = blob.dict(by_alias=True, exclude={"data"})
+    blob_dict["refcount"] = 1
+    while True:
+        try:
+            await blob_collection.insert_one(blob_dict)
+            return True
+        except DuplicateKeyError:
+            if await acquire_blob(blob.id) is not None:
+                await run_in_threadpool(get_blob_store().delete, blob.data_key)
+                return False
+            dead_blob = await blob_collection.find_one_and_replace(
+                {"_id": blob.id, "refcount": {"$lte": 0}},
+                blob_dict,
+                projection={"data_key": 1},
+            )
+            if dead_blob is not None:
+                await _delete_blob_data(dead_blob)
+                return True
+
+async def update_blob_text(sha256: str, encrypted_text: bytes, text_sha256: str, truncated: bool, content_type: str):
+    blob_collection = get_async_blob_collection()
+    await blob_collection.update_one(
+        {"_id": sha256},
+        {"$set": {
+            "text": encrypted_text,
+            "text_sha256": text_sha256,
+            "text_truncated": truncated,
+            "text_content_type": content_type,
+        }},
+    )
+
+async def open_blob(sha256: str) -> Optional[BinaryIO]:
+    blob_collection = get_async_blob_collection()
+    blob = await blob_collection.find_one({"_id": sha256}, projection={"data_key": 1, "data": 1})
+    if blob is None:
+        return None
+    if blob.get("data") is not None:
+        return io.BytesIO(blob["data"])
+    return await run_in_threadpool(get_blob_store().open, blob["data_key"])
+
+async def _delete_blob_data(blob: dict):
+    if blob.get("data_key"):
+        await run_in_threadpool(get_blob_store().delete, blob["data_key"])
+
+async def release_blob(sha256: str):
+    blob_collection = get_async_blob_collection()
+    await blob_collection.update_one({"_id": sha256}, {"$inc": {"refcount": -1}})
+    dead_blob = await blob_collection.find_one_and_delete(
+        {"_id": sha256, "refcount": {"$lte": 0}},
+        projection={"data_key": 1},
+    )
+    if dead_blob is not None:
+        await _delete_blob_data(dead_blob)
+
+# Feedback CRUD
+async def create_feedback(feedback: Feedback):
+    feedback_collection = get_async_feedback_collection()
+    result = await feedback_collection.insert_one(feedback.dict(exclude={'id'}))
+    print(f"DEBUG: Inserted feedback with id: {result.inserted_id}")
+    return str(result.inserted_id)
+
+# Analysis Feedback CRUD
+async def create_analysis_feedback(feedback: AnalysisFeedback):
+    feedback_collection = get_async_analysis_feedback_collection()
+    result = await feedback_collection.insert_one(feedback.dict(exclude={'id'}))
+    return str(result.inserted_id)
+
+async def create_analysis_feedbacks(feedbacks: List[AnalysisFeedback]) -> List[str]:
+    if not feedbacks:
+        return []
+    feedback_collection = get_async_analysis_feedback_collection()
+    result = await feedback_collection.insert_many([feedback.dict(exclude={'id'}) for feedback in feedbacks])
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+async def get_analysis_feedback_by_user_id(user_id: str):
+    feedback_collection = get_async_analysis_feedback_collection()
+    return await feedback_collection.find({"user_id": user_id}).sort("_id", 1).to_list(length=None)
+
+# Analysis cache CRUD
+async def get_cached_analysis(key: str, now: datetime):
+    analysis_cache_collection = get_async_analysis_cache_collection()
+    # The TTL monitor runs about once a minute; do not serve what it has not reaped yet.
+    return await analysis_cache_collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+
+async def put_cached_analysis(entry: dict):
+    analysis_cache_collection = get_async_analysis_cache_collection()
+    await analysis_cache_collection.replace_one({"_id": entry["_id"]}, entry, upsert=True)
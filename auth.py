@@ -1,34 +1,39 @@
+import hashlib
 import os
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from crud import get_user_by_username
+from async_crud import get_user_by_username
+from user_cache import user_cache
+from token_cache import token_cache
+from jwt_backends import InvalidTokenError, get_jwt_backend
+import hashing
 
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = os.environ.get("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Refresh tokens are opaque random strings tracked in the sessions collection.
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 14))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
-class TokenData(BaseModel):
-    username: Optional[str] = None
+# Password hashing runs on the dedicated hashing pool.
+async def hash_password(password: str) -> str:
+    return await hashing.pool.hash(password)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Return ``(verified, new_hash)``; ``new_hash`` is set when the stored hash should be replaced."""
+    return await hashing.pool.verify_and_update(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -37,24 +42,38 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = get_jwt_backend().encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token():
+    """Return a new refresh token and the hash under which its session is stored."""
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
+    # Tokens seen before skip signature verification until they expire.
+    username = token_cache.get(token)
+    if username is None:
+        try:
+            payload = get_jwt_backend().decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except InvalidTokenError:
+            raise credentials_exception
+        username = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = get_user_by_username(username=token_data.username)
+        token_cache.set(token, username, payload.get("exp"))
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_username(username=username)
+        if user is None:
+            raise credentials_exception
+        user_cache.set(username, user)
     return user
@@ -0,0 +1,79 @@
+"""Bounded in-process job queue for work that should not block a request.
+
+Each queue runs a fixed number of worker tasks per process, started and
+stopped by the application lifespan. Jobs are keyed: submitting a key that is
+already queued or running is a no-op, so callers can re-submit freely (for
+example on every poll). Jobs are not persisted; whatever a job is for must be
+recoverable if the process exits first (see get_questions in main.py).
+"""
+import asyncio
+import os
+import time
+import traceback
+from typing import Awaitable, Callable, Hashable, Set
+
+import metrics
+
+QUESTION_WORKERS = int(os.environ.get("QUESTION_WORKERS", 4))
+QUESTION_QUEUE_SIZE = int(os.environ.get("QUESTION_QUEUE_SIZE", 1000))
+CONTEXT_SUMMARY_WORKERS = int(os.environ.get("CONTEXT_SUMMARY_WORKERS", 2))
+CONTEXT_SUMMARY_QUEUE_SIZE = int(os.environ.get("CONTEXT_SUMMARY_QUEUE_SIZE", 1000))
+
+
+class BackgroundQueue:
+    def __init__(self, name: str, workers: int, max_size: int):
+        self.name = name
+        self.workers = workers
+        self.max_size = max_size
+        self._queue = None
+        self._tasks = []
+        self._keys: Set[Hashable] = set()
+        self._depth = metrics.gauge(f"background_{name}_queue_depth", f"{name} jobs waiting for a worker")
+        self._latency = metrics.histogram(f"background_{name}_latency_seconds", f"Run time of one {name} job")
+        self._failures = metrics.counter(f"background_{name}_failures_total", f"{name} jobs that raised")
+        self._dropped = metrics.counter(f"background_{name}_dropped_total", f"{name} jobs dropped because the queue was full")
+
+    def start(self):
+        self._queue = asyncio.Queue(self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._keys.clear()
+
+    def submit(self, key: Hashable, fn: Callable[[], Awaitable]) -> bool:
+        """Queue ``fn()`` unless ``key`` is already pending. False if it could not be queued."""
+        if key in self._keys:
+            return True
+        if self._queue is None or self._queue.full():
+            self._dropped.inc()
+            return False
+        self._keys.add(key)
+        self._queue.put_nowait((key, fn))
+        self._depth.set(self._queue.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            key, fn = await self._queue.get()
+            self._depth.set(self._queue.qsize())
+            started = time.perf_counter()
+            try:
+                await fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._failures.inc()
+                print(f"ERROR: background {self.name} job {key!r} failed:")
+                traceback.print_exc()
+            finally:
+                self._latency.observe(time.perf_counter() - started)
+                self._keys.discard(key)
+
+
+question_queue = BackgroundQueue("questions", QUESTION_WORKERS, QUESTION_QUEUE_SIZE)
+context_summary_queue = BackgroundQueue("context_summary", CONTEXT_SUMMARY_WORKERS, CONTEXT_SUMMARY_QUEUE_SIZE)
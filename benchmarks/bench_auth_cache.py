@@ -0,0 +1,69 @@
+"""Per-request authentication overhead with and without the user cache.
+
+Inserts a throwaway user into the configured MongoDB, issues a token for it,
+then times auth.get_current_user (JWT decode + user lookup) with the cache
+disabled and enabled, and removes the user again.
+
+    MONGO_URI=... python benchmarks/bench_auth_cache.py [--iterations 2000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import database
+from user_cache import user_cache
+
+
+async def measure(iterations: int, token: str):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await auth.get_current_user(token)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings) * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+
+async def run(iterations: int):
+    username = f"bench-{uuid.uuid4().hex}@example.com"
+    users = database.get_async_user_collection()
+    await users.insert_one({"username": username, "email": username, "password": "x"})
+    try:
+        token = auth.create_access_token({"sub": username})
+        ttl = user_cache.ttl
+
+        user_cache.ttl = 0
+        await measure(50, token)  # warm up the connection pool
+        uncached = await measure(iterations, token)
+
+        user_cache.ttl = ttl or 60
+        cached = await measure(iterations, token)
+    finally:
+        await users.delete_one({"username": username})
+        user_cache.clear()
+
+    print(f"{'':<10}{'median':>12}{'p99':>12}")
+    print(f"{'no cache':<10}{uncached[0]:>10.0f}us{uncached[1]:>10.0f}us")
+    print(f"{'cache':<10}{cached[0]:>10.0f}us{cached[1]:>10.0f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    database.connect()
+    try:
+        asyncio.run(run(args.iterations))
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
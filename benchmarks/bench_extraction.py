@@ -0,0 +1,115 @@
+"""Microbenchmarks for PDF/DOCX text extraction on synthetic documents.
+
+Compares the original whole-document ``text +=`` extraction with the budgeted
+generator-based extraction in extraction.py, in-process (no pool), for
+1/10/100/500-page documents.
+
+    python benchmarks/bench_extraction.py [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import docx
+import pypdf
+
+from extraction import EXTRACTION_MAX_CHARS, EXTRACTION_MAX_PAGES, extract_text_from_docx, extract_text_from_pdf
+
+PAGE_COUNTS = (1, 10, 100, 500)
+LINES_PER_PAGE = 45
+
+
+def make_pdf(pages: int) -> bytes:
+    """Build a minimal text PDF by hand; pypdf cannot lay out text itself."""
+    font_id = 3 + 2 * pages
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{3 + 2 * i} 0 R" for i in range(pages)), pages)).encode(),
+    ]
+    for i in range(pages):
+        lines = "".join(
+            f"(Page {i} line {j}: experienced Python engineer with FastAPI and MongoDB) Tj 0 -16 Td "
+            for j in range(LINES_PER_PAGE)
+        )
+        stream = f"BT /F1 10 Tf 40 760 Td {lines}ET".encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_docx(pages: int) -> bytes:
+    document = docx.Document()
+    for i in range(pages):
+        for j in range(LINES_PER_PAGE):
+            document.add_paragraph(f"Page {i} line {j}: experienced Python engineer with FastAPI and MongoDB")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+# The extractors as they were before budgets were introduced.
+def legacy_pdf(file) -> str:
+    text = ""
+    for page in pypdf.PdfReader(file).pages:
+        text += page.extract_text()
+    return text
+
+
+def legacy_docx(file) -> str:
+    text = ""
+    for para in docx.Document(file).paragraphs:
+        text += para.text + "\n"
+    return text
+
+
+def best_of(repeat: int, fn, data: bytes):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(io.BytesIO(data))
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"budgets: {EXTRACTION_MAX_PAGES} pages, {EXTRACTION_MAX_CHARS} chars; best of {args.repeat}")
+    print(f"{'doc':>5} {'pages':>6} {'legacy ms':>10} {'chars':>9} {'budgeted ms':>12} {'chars':>9} {'truncated':>10}")
+    for kind, make, legacy, budgeted in (
+        ("pdf", make_pdf, legacy_pdf, extract_text_from_pdf),
+        ("docx", make_docx, legacy_docx, extract_text_from_docx),
+    ):
+        for pages in PAGE_COUNTS:
+            data = make(pages)
+            legacy_time, legacy_text = best_of(args.repeat, legacy, data)
+            budgeted_time, result = best_of(args.repeat, budgeted, data)
+            print(
+                f"{kind:>5} {pages:>6} {legacy_time * 1000:>10.1f} {len(legacy_text):>9} "
+                f"{budgeted_time * 1000:>12.1f} {len(result.text):>9} {str(result.truncated):>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
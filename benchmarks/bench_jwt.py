@@ -0,0 +1,79 @@
+"""Microbenchmarks for token issue and verification across JWT backends.
+
+For every installed backend (see jwt_backends.py) this times
+auth.create_access_token and auth.get_current_user, the latter with the
+verified-token cache disabled and enabled. The user lookup is served from a
+pre-filled user cache, so no MongoDB is needed and only the token work is
+measured.
+
+    python benchmarks/bench_jwt.py [--iterations 20000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import jwt_backends
+from token_cache import token_cache
+from user_cache import user_cache
+
+USERNAME = "bench@example.com"
+
+
+def measure_sync(iterations: int, fn):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+async def measure_async(iterations: int, fn):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+async def bench_backend(iterations: int):
+    token = auth.create_access_token({"sub": USERNAME})
+    create = measure_sync(iterations, lambda: auth.create_access_token({"sub": USERNAME}))
+
+    max_size = token_cache.max_size
+    token_cache.max_size = 0
+    verify = await measure_async(iterations, lambda: auth.get_current_user(token))
+    token_cache.max_size = max_size or 10000
+    cached = await measure_async(iterations, lambda: auth.get_current_user(token))
+    token_cache.clear()
+    return create, verify, cached
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    user_cache.ttl = 3600
+    user_cache.set(USERNAME, {"_id": "bench", "username": USERNAME, "email": USERNAME})
+
+    print(f"{'backend':<10}{'create':>12}{'verify':>12}{'cached':>12}   (median per call)")
+    for name in jwt_backends.BACKENDS:
+        backend = jwt_backends.available_backends().get(name)
+        if backend is None:
+            print(f"{name:<10}{'not installed':>12}")
+            continue
+        jwt_backends._jwt_backend = backend
+        create, verify, cached = asyncio.run(bench_backend(args.iterations))
+        print(f"{name:<10}{create:>10.1f}us{verify:>10.1f}us{cached:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
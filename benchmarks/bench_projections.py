@@ -0,0 +1,86 @@
+"""Bytes transferred and latency per endpoint read: full upload document vs. projections.
+
+Inserts a synthetic upload (for a throwaway user id) into the configured
+MongoDB, replays the read each endpoint performs with and without field
+projection, reports the BSON size of what came back and the median latency,
+and removes the synthetic document again.
+
+    MONGO_URI=... ENCRYPTION_KEY=... python benchmarks/bench_projections.py [--iterations 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+from bson import ObjectId
+
+import crud
+from database import get_upload_collection
+from encryption import encrypt_file
+
+
+def synthetic_upload(user_id: str, legacy_inline: bool) -> dict:
+    resume_text = ("Senior backend engineer, Python, FastAPI, MongoDB. " * 1200)[:60000]
+    job_description_text = ("We are hiring a backend engineer to build APIs. " * 1200)[:60000]
+    upload = {
+        "user_id": user_id,
+        "resume_sha256": "0" * 64,
+        "job_description_sha256": "1" * 64,
+        "resume_text": encrypt_file(resume_text.encode()),
+        "job_description_text": encrypt_file(job_description_text.encode()),
+        "filename_resume": "resume.pdf",
+        "filename_job_description": "jd.pdf",
+        "experience": "experienced",
+        "yearsOfExperience": "5",
+        "generated_questions": [f"Question {i} about distributed systems and APIs?" for i in range(20)],
+    }
+    if legacy_inline:
+        # Uploads written before blobs moved out of the document.
+        upload["resume"] = encrypt_file(os.urandom(2 * 1024 * 1024))
+        upload["job_description"] = encrypt_file(os.urandom(512 * 1024))
+    return upload
+
+
+def measure(iterations: int, read):
+    timings = []
+    size = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        doc = read()
+        timings.append(time.perf_counter() - started)
+        size = len(bson.encode(doc))
+    return size, statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--legacy-inline", action="store_true", help="also store inline file bytes, like pre-blob-store uploads")
+    args = parser.parse_args()
+
+    user_id = f"bench-{ObjectId()}"
+    upload_collection = get_upload_collection()
+    upload_collection.insert_one(synthetic_upload(user_id, args.legacy_inline))
+    try:
+        full = lambda: crud.get_latest_upload_by_user_id(user_id)
+        cases = [
+            ("GET /api/job-description", full, lambda: crud.get_latest_upload_text(user_id, ("job_description",))),
+            ("GET /api/questions (cached)", full, lambda: crud.get_latest_upload_questions(user_id)),
+            ("POST /api/analyze-answer", full, lambda: crud.get_latest_upload_text(user_id)),
+            ("upload metadata", full, lambda: crud.get_latest_upload_meta(user_id)),
+        ]
+        print(f"{'read':<30} {'full bytes':>11} {'full ms':>8} {'projected bytes':>16} {'projected ms':>13}")
+        for name, before, after in cases:
+            before_size, before_ms = measure(args.iterations, before)
+            after_size, after_ms = measure(args.iterations, after)
+            print(f"{name:<30} {before_size:>11} {before_ms:>8.2f} {after_size:>16} {after_ms:>13.2f}")
+    finally:
+        upload_collection.delete_many({"user_id": user_id})
+
+
+if __name__ == "__main__":
+    main()
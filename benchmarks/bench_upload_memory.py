@@ -0,0 +1,110 @@
+"""Peak RSS of the /api/upload ingest path: whole-file reads vs. streaming spool.
+
+Simulates N concurrent uploads of SIZE_MB each (one resume + one job description)
+and reports the process high-water RSS for each mode. Every mode runs in a fresh
+subprocess so the peaks do not contaminate each other.
+
+    python benchmarks/bench_upload_memory.py [--uploads 10] [--size-mb 10]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.datastructures import UploadFile
+
+
+def make_upload(size: int, name: str) -> UploadFile:
+    # Starlette spools multipart parts to disk above 1 MB; mirror that here so
+    # the fixture itself does not count against the measured peak.
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    block = os.urandom(1024 * 1024)
+    written = 0
+    while written < size:
+        spool.write(block[:size - written])
+        written += len(block)
+    spool.seek(0)
+    return UploadFile(spool, filename=name, size=size)
+
+
+async def ingest_before(resume: UploadFile, job_description: UploadFile):
+    from encryption import encrypt_file
+
+    resume_content = await resume.read()
+    job_description_content = await job_description.read()
+    upload_dict = {
+        "resume": encrypt_file(resume_content),
+        "job_description": encrypt_file(job_description_content),
+    }
+    # Creating an upload used to print the whole document.
+    f"DEBUG: Inserting upload_dict: {upload_dict}"
+    await asyncio.sleep(0)
+
+
+async def ingest_after(resume: UploadFile, job_description: UploadFile):
+    from blobstore import LocalBlobStore
+    from ingest import spool_upload
+
+    store = LocalBlobStore(tempfile.mkdtemp(prefix="bench-blobs-"))
+    spooled_job_description = await spool_upload(job_description)
+    spooled_resume = await spool_upload(resume)
+    try:
+        for i, spooled in enumerate((spooled_resume, spooled_job_description)):
+            store.put(f"{id(spooled)}-{i}", spooled.open_encrypted())
+        upload_dict = {
+            "resume_sha256": spooled_resume.sha256,
+            "job_description_sha256": spooled_job_description.sha256,
+        }
+        f"DEBUG: Inserting upload_dict with fields: {list(upload_dict)}"
+        await asyncio.sleep(0)
+    finally:
+        spooled_resume.close()
+        spooled_job_description.close()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def run_mode(mode: str, uploads: int, size: int):
+    ingest = ingest_before if mode == "before" else ingest_after
+    files = [
+        (make_upload(size, f"resume-{i}.pdf"), make_upload(size, f"jd-{i}.pdf"))
+        for i in range(uploads)
+    ]
+    baseline = peak_rss_mb()
+    await asyncio.gather(*(ingest(resume, jd) for resume, jd in files))
+    print(f"{mode:>6}: baseline {baseline:8.1f} MB  peak {peak_rss_mb():8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--size-mb", type=int, default=10)
+    parser.add_argument("--mode", choices=["before", "after"])
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    if args.mode:
+        os.environ.setdefault("MAX_UPLOAD_BYTES", str(size))
+        asyncio.run(run_mode(args.mode, args.uploads, size))
+        return
+
+    print(f"{args.uploads} concurrent uploads, 2 x {args.size_mb} MB each")
+    for mode in ("before", "after"):
+        subprocess.run(
+            [sys.executable, __file__, "--mode", mode,
+             "--uploads", str(args.uploads), "--size-mb", str(args.size_mb)],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Concurrent-connection load test against a running instance of the API.
+
+Registers (or reuses) a test user, then keeps N connections busy against one
+endpoint for a fixed duration and reports throughput and latency percentiles.
+Run it against the build before and after a change to compare, e.g.:
+
+    uvicorn main:app --workers 1 &
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 500 --path /users/me
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def get_token(client: httpx.AsyncClient, username: str, password: str) -> str:
+    await client.post("/register", data={"username": username, "password": password})
+    response = await client.post("/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def worker(client: httpx.AsyncClient, method: str, path: str, headers: dict, deadline: float, latencies: list, errors: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, headers=headers)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        headers = {}
+        if not args.anonymous:
+            headers["Authorization"] = f"Bearer {await get_token(client, args.username, args.password)}"
+        latencies, errors = [], []
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            worker(client, args.method, args.path, headers, deadline, latencies, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.method} {args.path}  concurrency={args.concurrency}  duration={elapsed:.1f}s")
+    print(f"  requests ok: {len(latencies)}  errors: {len(errors)}  throughput: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(
+            f"  latency ms  p50 {percentile(latencies, 50) * 1000:.1f}  p95 {percentile(latencies, 95) * 1000:.1f}  "
+            f"p99 {percentile(latencies, 99) * 1000:.1f}  mean {statistics.mean(latencies) * 1000:.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/users/me")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--username", default="loadtest@example.com")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--anonymous", action="store_true", help="do not authenticate")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Latency of an unrelated endpoint while the API is under a login storm.
+
+Measures the probe endpoint alone first, then again while --storm clients log
+in as fast as they can, and compares the p99s. With bcrypt on its own
+HASHING_WORKERS threads the storm no longer occupies the shared threadpool, so
+what remains is CPU contention; run the server on more cores than
+HASHING_WORKERS to see the probe stay flat.
+
+    uvicorn main:app --workers 1 &
+    python benchmarks/login_storm.py --url http://127.0.0.1:8000 --storm 200
+
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from load_test import get_token, percentile, worker
+
+
+async def login_worker(client: httpx.AsyncClient, username: str, password: str, deadline: float, outcomes: dict):
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.post("/login", data={"username": username, "password": password})
+            outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+        except httpx.HTTPError as e:
+            outcomes[type(e).__name__] = outcomes.get(type(e).__name__, 0) + 1
+
+
+async def probe(client: httpx.AsyncClient, args, headers: dict, storm: int):
+    latencies, errors, outcomes = [], [], {}
+    deadline = time.perf_counter() + args.duration
+    await asyncio.gather(
+        *(worker(client, "GET", args.path, headers, deadline, latencies, errors) for _ in range(args.concurrency)),
+        *(login_worker(client, args.username, args.password, deadline, outcomes) for _ in range(storm)),
+    )
+    label = f"with {storm} logging-in clients" if storm else "baseline"
+    print(f"GET {args.path} {label}:")
+    print(f"  requests ok: {len(latencies)}  errors: {len(errors)}")
+    if latencies:
+        print(
+            f"  latency ms  p50 {percentile(latencies, 50) * 1000:.1f}  p99 {percentile(latencies, 99) * 1000:.1f}  "
+            f"mean {statistics.mean(latencies) * 1000:.1f}"
+        )
+    if outcomes:
+        print(f"  login responses: {outcomes}")
+    return percentile(latencies, 99)
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency + args.storm)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        headers = {"Authorization": f"Bearer {await get_token(client, args.username, args.password)}"}
+        baseline = await probe(client, args, headers, 0)
+        stormy = await probe(client, args, headers, args.storm)
+    print(f"p99 ratio under storm: {stormy / baseline:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/metrics", help="unrelated endpoint to probe (/metrics runs on the shared threadpool)")
+    parser.add_argument("--concurrency", type=int, default=20, help="clients polling the probe endpoint")
+    parser.add_argument("--storm", type=int, default=200, help="clients logging in concurrently")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--username", default="loadtest@example.com")
+    parser.add_argument("--password", default="loadtest-password")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
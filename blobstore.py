@@ -0,0 +1,121 @@
+import io
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
+import gridfs
+
+# Which backend holds file data: "gridfs" (default) or "local".
+BLOB_STORE = os.environ.get("BLOB_STORE", "gridfs")
+BLOB_STORE_PATH = os.environ.get("BLOB_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "blob_data"))
+BLOB_CHUNK_SIZE = int(os.environ.get("BLOB_CHUNK_SIZE", 255 * 1024))
+
+
+class BlobStore:
+    """Opaque byte storage keyed by string. Reads and writes are streamed in chunks."""
+
+    def put(self, key: str, fileobj: BinaryIO) -> int:
+        """Store everything readable from ``fileobj`` under ``key``. Returns the size."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """Open the data stored under ``key`` for streaming reads."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def put_bytes(self, key: str, data: bytes) -> int:
+        return self.put(key, io.BytesIO(data))
+
+    def read(self, key: str) -> bytes:
+        with self.open(key) as fileobj:
+            return fileobj.read()
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, bucket_name: str = "blob_data", chunk_size: int = BLOB_CHUNK_SIZE):
+        from database import get_db
+        db = get_db()
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=chunk_size)
+        self.files = db.get_collection(f"{bucket_name}.files")
+
+    def put(self, key: str, fileobj: BinaryIO) -> int:
+        self.bucket.upload_from_stream_with_id(key, key, fileobj)
+        return self.files.find_one({"_id": key}, projection={"length": 1})["length"]
+
+    def open(self, key: str) -> BinaryIO:
+        return self.bucket.open_download_stream(key)
+
+    def delete(self, key: str):
+        try:
+            self.bucket.delete(key)
+        except gridfs.errors.NoFile:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return self.files.count_documents({"_id": key}, limit=1) > 0
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str = BLOB_STORE_PATH, chunk_size: int = BLOB_CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Fan out into subdirectories so no single directory grows unbounded.
+        return os.path.join(self.root, key[-2:], key)
+
+    def put(self, key: str, fileobj: BinaryIO) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file in the same directory and rename, so readers
+        # never see a partially written blob.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(fileobj, out, self.chunk_size)
+                size = out.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return size
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb", buffering=self.chunk_size)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    if _blob_store is None:
+        if BLOB_STORE == "gridfs":
+            _blob_store = GridFSBlobStore()
+        elif BLOB_STORE == "local":
+            _blob_store = LocalBlobStore()
+        else:
+            raise ValueError(f"Unknown BLOB_STORE {BLOB_STORE!r}; expected 'gridfs' or 'local'.")
+    return _blob_store
+
+
+def close_blob_store():
+    """Drop the store so the next get_blob_store() binds to the current connection."""
+    global _blob_store
+    _blob_store = None
@@ -0,0 +1,243 @@
+"""Provider-side caching of the context every analysis of an upload starts with.
+
+Each analysis prompt opens with the same prefix for a given upload: the grading
+instructions, the job description and the resume. With a context cache that
+prefix is stored once per upload and each analysis sends only the question and
+answer. Context summaries (see context_summary.py) are turned off while a
+backend is set: a summarized prefix is rarely large enough to be cached, so the
+full texts are cached instead. CONTEXT_CACHE_BACKEND selects:
+
+* ``none`` (default) - no caching; the whole prompt is sent every time;
+* ``gemini`` - Gemini cached content. The purpose's model must support
+  caching, and Gemini refuses contexts below a model-specific size, so shorter
+  ones (CONTEXT_CACHE_MIN_TOKENS) are not cached;
+* ``local`` - an in-process stand-in that prepends the stored context to each
+  prompt. Same flow without the caching API, for development and tests; its
+  contexts are not shared between workers.
+
+Cached contexts live for CONTEXT_CACHE_TTL_SECONDS. The handle is stored on the
+upload so every worker reuses it, and a new one is created once it is about to
+expire or the context changes.
+Gemini removes expired contexts itself; one replaced before expiry is deleted.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional
+
+import google.generativeai as genai
+
+import async_crud
+import llm
+import metrics
+from lru import ExpiringLRU
+from singleflight import SingleFlight
+
+CONTEXT_CACHE_BACKEND = os.environ.get("CONTEXT_CACHE_BACKEND", "none")
+CONTEXT_CACHE_TTL_SECONDS = float(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", 3600))
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", 1024))
+# After a failed creation, send whole prompts for this long before trying again.
+CONTEXT_CACHE_RETRY_SECONDS = float(os.environ.get("CONTEXT_CACHE_RETRY_SECONDS", 300))
+# A context expiring sooner than this could expire mid-request; replace it.
+CONTEXT_CACHE_MIN_REMAINING_SECONDS = 120
+
+
+class CachedContext(NamedTuple):
+    name: str
+    # UTC, like every other datetime stored in MongoDB here.
+    expires_at: datetime
+
+
+class ContextNotFound(Exception):
+    """The backend no longer has (or never had) a cached context."""
+
+
+class ContextCacheBackend:
+    name = ""
+
+    async def create(self, purpose: str, context: str, ttl: float) -> CachedContext:
+        raise NotImplementedError
+
+    async def model(self, purpose: str, name: str):
+        """A client for ``purpose`` whose prompts continue the cached context ``name``."""
+        raise NotImplementedError
+
+    async def delete(self, name: str):
+        raise NotImplementedError
+
+
+class GeminiContextCache(ContextCacheBackend):
+    name = "gemini"
+
+    def __init__(self):
+        from google.generativeai import caching
+        self._caching = caching
+        # name -> (expires_at, GenerativeModel); building one fetches the cached content.
+        self._models: Dict[str, tuple] = {}
+
+    def _forget_expired(self):
+        now = datetime.utcnow()
+        for name in [name for name, (expires_at, _) in self._models.items() if expires_at <= now]:
+            del self._models[name]
+
+    async def create(self, purpose: str, context: str, ttl: float) -> CachedContext:
+        self._forget_expired()
+        cached = await asyncio.to_thread(
+            self._caching.CachedContent.create,
+            model=llm.PURPOSES[purpose].model,
+            contents=[context],
+            ttl=timedelta(seconds=ttl),
+        )
+        return CachedContext(cached.name, datetime.utcnow() + timedelta(seconds=ttl))
+
+    async def model(self, purpose: str, name: str):
+        if name not in self._models:
+            from google.api_core.exceptions import NotFound
+            try:
+                cached = await asyncio.to_thread(self._caching.CachedContent.get, name)
+            except NotFound as e:
+                raise ContextNotFound(name) from e
+            model = genai.GenerativeModel.from_cached_content(
+                cached, generation_config=llm.gateway.registry.generation_config(purpose)
+            )
+            self._models[name] = (cached.expire_time.replace(tzinfo=None), model)
+        return self._models[name][1]
+
+    async def delete(self, name: str):
+        self._models.pop(name, None)
+        await asyncio.to_thread(lambda: self._caching.CachedContent.get(name).delete())
+
+
+class _LocalCachedModel:
+    def __init__(self, model, context: str):
+        self._model = model
+        self._context = context
+
+    def generate_content_async(self, prompt: str, **kwargs):
+        return self._model.generate_content_async(self._context + prompt, **kwargs)
+
+
+class LocalContextCache(ContextCacheBackend):
+    name = "local"
+
+    def __init__(self):
+        # name -> (expires_at, context)
+        self._contexts: Dict[str, tuple] = {}
+
+    def _forget_expired(self):
+        now = datetime.utcnow()
+        for name in [name for name, (expires_at, _) in self._contexts.items() if expires_at <= now]:
+            del self._contexts[name]
+
+    async def create(self, purpose: str, context: str, ttl: float) -> CachedContext:
+        self._forget_expired()
+        cached = CachedContext(f"local/{uuid.uuid4().hex}", datetime.utcnow() + timedelta(seconds=ttl))
+        self._contexts[cached.name] = (cached.expires_at, context)
+        return cached
+
+    async def model(self, purpose: str, name: str):
+        self._forget_expired()
+        if name not in self._contexts:
+            raise ContextNotFound(name)
+        return _LocalCachedModel(llm.gateway.registry.model(purpose), self._contexts[name][1])
+
+    async def delete(self, name: str):
+        self._contexts.pop(name, None)
+
+
+BACKENDS = {
+    GeminiContextCache.name: GeminiContextCache,
+    LocalContextCache.name: LocalContextCache,
+}
+
+_context_cache_backend: Optional[ContextCacheBackend] = None
+
+
+def get_context_cache_backend() -> Optional[ContextCacheBackend]:
+    """The configured backend, or None when context caching is off."""
+    global _context_cache_backend
+    if CONTEXT_CACHE_BACKEND == "none":
+        return None
+    if _context_cache_backend is None:
+        if CONTEXT_CACHE_BACKEND not in BACKENDS:
+            raise ValueError(
+                f"Unknown CONTEXT_CACHE_BACKEND {CONTEXT_CACHE_BACKEND!r}; expected none or one of {', '.join(BACKENDS)}."
+            )
+        _context_cache_backend = BACKENDS[CONTEXT_CACHE_BACKEND]()
+    return _context_cache_backend
+
+
+def context_cache_key(backend: str, purpose: str, context: str) -> str:
+    material = json.dumps([backend, llm.PURPOSES[purpose].model, context])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+context_flights = SingleFlight("context_cache")
+_created = metrics.counter("context_cache_created_total", "Cached contexts created")
+_reused = metrics.counter("context_cache_reused_total", "Generations that reused a cached context")
+_failures = metrics.counter("context_cache_failures_total", "Cached contexts that could not be created or used")
+# (upload id, key) of contexts that failed recently in this worker.
+_failed = ExpiringLRU(10000)
+
+
+async def _create(backend: ContextCacheBackend, upload_id: str, purpose: str, context: str, key: str, stale: Optional[dict]) -> dict:
+    cached = await backend.create(purpose, context, CONTEXT_CACHE_TTL_SECONDS)
+    handle = {"backend": backend.name, "name": cached.name, "key": key, "expires_at": cached.expires_at}
+    await async_crud.update_upload_context_cache(upload_id, handle)
+    _created.inc()
+    if stale and stale.get("backend") == backend.name and stale["expires_at"] > datetime.utcnow():
+        try:
+            await backend.delete(stale["name"])
+        except Exception as e:
+            print(f"WARNING: could not delete replaced cached context {stale['name']}: {e}")
+    return handle
+
+
+async def cached_model(upload: dict, purpose: str, context: str):
+    """A client for ``purpose`` with ``context`` cached for this upload, or None to send whole prompts.
+
+    ``upload`` needs its _id and context_cache fields; the handle is updated
+    in place so later calls with the same dict reuse it.
+    """
+    backend = get_context_cache_backend()
+    if backend is None or llm.estimate_tokens(context) < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    upload_id = str(upload["_id"])
+    key = context_cache_key(backend.name, purpose, context)
+    if _failed.get((upload_id, key)) is not None:
+        return None
+    handle = upload.get("context_cache")
+    fresh = datetime.utcnow() + timedelta(seconds=CONTEXT_CACHE_MIN_REMAINING_SECONDS)
+    # A second attempt covers a stored handle the backend does not know.
+    for _ in range(2):
+        try:
+            if not (handle and handle.get("key") == key and handle["expires_at"] > fresh):
+                stale = handle
+                handle = await context_flights.do(
+                    (upload_id, key), lambda: _create(backend, upload_id, purpose, context, key, stale)
+                )
+                upload["context_cache"] = handle
+            else:
+                _reused.inc()
+            return await backend.model(purpose, handle["name"])
+        except ContextNotFound:
+            handle = None
+        except Exception as e:
+            _failures.inc()
+            _failed.set((upload_id, key), True, time.monotonic() + CONTEXT_CACHE_RETRY_SECONDS)
+            print(f"WARNING: cached context for upload {upload_id} failed, sending whole prompts: {e}")
+            return None
+    return None
+
+
+async def forget(upload: dict):
+    """Stop using the upload's cached context after a generation with it failed."""
+    handle = upload.pop("context_cache", None)
+    _failures.inc()
+    if handle is not None:
+        _failed.set((str(upload["_id"]), handle["key"]), True, time.monotonic() + CONTEXT_CACHE_RETRY_SECONDS)
+        await async_crud.update_upload_context_cache(str(upload["_id"]), None)
@@ -0,0 +1,180 @@
+"""Condensed resume and job description for answer-analysis prompts.
+
+Every analysis grades one answer against the same two documents, and their
+full text is usually most of the prompt. Once per upload, Gemini condenses them
+into a short list of job requirements and a short candidate profile, which the
+analysis prompt uses in their place.
+
+The summary is stored on the upload, encrypted like the texts it was made from.
+Its key covers the summary prompt version, the model and the hashes of both
+texts, so a stale summary is never used. It is only ever generated in the
+background (see upload_files in main.py): requests use the stored summary if
+it is ready and the full texts otherwise, so no request waits for a summary.
+Workers coordinate through a lease on the upload, so each summary is generated
+once. When the texts are already short (CONTEXT_SUMMARY_MIN_TOKENS), or the
+summary cannot be made, the full texts are used as before; a failed summary is
+retried after CONTEXT_SUMMARY_RETRY_SECONDS.
+
+Summaries and provider-side context caching (see context_cache.py) are
+alternatives: a summarized prefix is almost always below the size providers
+will cache. With a CONTEXT_CACHE_BACKEND set, no summaries are made and the
+full texts are cached instead.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+
+import async_crud
+import context_cache
+import llm
+import metrics
+import prompts
+from encryption import decrypt_file, encrypt_file
+from extraction import text_sha256
+from lru import ExpiringLRU
+
+CONTEXT_SUMMARY_ENABLED = os.environ.get("CONTEXT_SUMMARY_ENABLED", "true").lower() == "true"
+# Below this estimated size the full texts cost about as much as a summary.
+CONTEXT_SUMMARY_MIN_TOKENS = int(os.environ.get("CONTEXT_SUMMARY_MIN_TOKENS", 800))
+CONTEXT_SUMMARY_MAX_WORDS = int(os.environ.get("CONTEXT_SUMMARY_MAX_WORDS", 300))
+# After a failed generation, use the full texts for this long before trying again.
+CONTEXT_SUMMARY_RETRY_SECONDS = float(os.environ.get("CONTEXT_SUMMARY_RETRY_SECONDS", 300))
+CONTEXT_SUMMARY_LEASE_SECONDS = llm.PURPOSES["summary"].timeout + 30
+# Bump whenever the summary prompt below changes.
+CONTEXT_SUMMARY_VERSION = 1
+
+SECTION_HEADING = re.compile(r"^\s*#*\s*\**\s*(JOB REQUIREMENTS|CANDIDATE PROFILE)\s*\**\s*:?\s*\**\s*$", re.IGNORECASE | re.MULTILINE)
+
+# (upload id, key) of generations that failed recently in this worker.
+_failed = ExpiringLRU(10000)
+_generated = metrics.counter("context_summary_generated_total", "Upload context summaries generated")
+_failures = metrics.counter("context_summary_failures_total", "Upload context summaries that could not be generated")
+
+
+def context_summary_key(resume_text_sha256: str, job_description_text_sha256: str) -> str:
+    material = json.dumps([
+        CONTEXT_SUMMARY_VERSION,
+        llm.PURPOSES["summary"].model,
+        CONTEXT_SUMMARY_MAX_WORDS,
+        resume_text_sha256,
+        job_description_text_sha256,
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def build_summary_prompt(resume_text: str, job_description_text: str) -> str:
+    resume_text = prompts.fit("resume_source", resume_text)
+    job_description_text = prompts.fit("job_description_source", job_description_text)
+    return f"""Condense the job description and resume below for an interviewer who will grade many interview answers against them.
+
+Reply with exactly these two sections and nothing else:
+
+JOB REQUIREMENTS:
+- one line per requirement: skills and technologies, seniority, responsibilities, domain
+
+CANDIDATE PROFILE:
+- one line per fact: years and level of experience, skills and technologies, notable roles and projects, education
+
+Keep the names of technologies, tools, companies and domains exactly as written. Leave out anything that does not help judge an interview answer. Use at most {CONTEXT_SUMMARY_MAX_WORDS} words in total.
+
+Job Description:
+{job_description_text}
+
+Resume:
+{resume_text}
+"""
+
+
+def parse_summary(text: str) -> dict:
+    """Split the model's reply into its two sections; ValueError if either is missing."""
+    sections = {}
+    headings = list(SECTION_HEADING.finditer(text))
+    for heading, following in zip(headings, headings[1:] + [None]):
+        end = following.start() if following else len(text)
+        sections[heading.group(1).upper()] = text[heading.end():end].strip()
+    summary = {
+        "job_requirements": sections.get("JOB REQUIREMENTS", ""),
+        "candidate_profile": sections.get("CANDIDATE PROFILE", ""),
+    }
+    if not all(summary.values()):
+        raise ValueError("The AI service returned a summary without both sections.")
+    return summary
+
+
+def summaries_enabled() -> bool:
+    return CONTEXT_SUMMARY_ENABLED and context_cache.CONTEXT_CACHE_BACKEND == "none"
+
+
+def needs_summary(resume_text: str, job_description_text: str) -> bool:
+    return summaries_enabled() and (
+        llm.estimate_tokens(resume_text) + llm.estimate_tokens(job_description_text) >= CONTEXT_SUMMARY_MIN_TOKENS
+    )
+
+
+def _summary_key(upload: dict, resume_text: str, job_description_text: str) -> str:
+    return context_summary_key(
+        upload.get("resume_text_sha256") or text_sha256(resume_text),
+        upload.get("job_description_text_sha256") or text_sha256(job_description_text),
+    )
+
+
+def get_context_summary(upload: dict, resume_text: str, job_description_text: str) -> Optional[dict]:
+    """The upload's stored summary ({"job_requirements", "candidate_profile"}), or None to use the full texts.
+
+    ``upload`` needs its text hashes and context_summary fields, if stored.
+    """
+    if not needs_summary(resume_text, job_description_text):
+        return None
+    if upload.get("context_summary") is None or upload.get("context_summary_key") != _summary_key(upload, resume_text, job_description_text):
+        return None
+    return json.loads(decrypt_file(upload["context_summary"]))
+
+
+def summary_pending(upload: dict, resume_text: str, job_description_text: str) -> bool:
+    """True if the upload should have a summary, has none, and no worker is on it or just failed to make it."""
+    if not needs_summary(resume_text, job_description_text):
+        return False
+    key = _summary_key(upload, resume_text, job_description_text)
+    if upload.get("context_summary_key") == key or _failed.get((str(upload["_id"]), key)) is not None:
+        return False
+    lease = upload.get("context_summary_lease")
+    return not (lease and lease["expires_at"] > datetime.utcnow())
+
+
+async def generate_context_summary(upload: dict, resume_text: str, job_description_text: str):
+    """Generate and store the upload's summary, unless it is not needed or another worker is on it.
+
+    Runs in the background (see prepare_context_summary in main.py).
+    """
+    if not summary_pending(upload, resume_text, job_description_text):
+        return
+    upload_id = str(upload["_id"])
+    key = _summary_key(upload, resume_text, job_description_text)
+    owner = f"{os.getpid()}-{ObjectId()}"
+    if not await async_crud.acquire_context_summary_lease(upload_id, owner, key, datetime.utcnow(), CONTEXT_SUMMARY_LEASE_SECONDS):
+        return
+    try:
+        response = await llm.generate_content(build_summary_prompt(resume_text, job_description_text), "summary")
+        summary = parse_summary(response.text)
+    except BaseException as e:
+        await async_crud.release_context_summary_lease(upload_id, owner)
+        if not isinstance(e, Exception):
+            raise
+        _failures.inc()
+        _failed.set((upload_id, key), True, time.monotonic() + CONTEXT_SUMMARY_RETRY_SECONDS)
+        print(f"WARNING: context summary for upload {upload_id} failed, using the full texts: {e}")
+        return
+    await async_crud.update_upload_context_summary(upload_id, owner, encrypt_file(json.dumps(summary).encode("utf-8")), key)
+    _generated.inc()
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        print(
+            f"INFO: context summary for upload {upload_id}: {usage.prompt_token_count} prompt tokens, "
+            f"{usage.candidates_token_count} output tokens"
+        )
@@ -1,69 +1,137 @@
-from database import (
-    get_user_collection,
-    get_upload_collection,
-    get_feedback_collection,
-    get_analysis_feedback_collection,
-    User,
-    Upload,
-    Feedback,
-    AnalysisFeedback
-)
-from bson import ObjectId
-from typing import List
+"""Synchronous repository layer for scripts and benchmarks.
 
-# User CRUD
-def create_user(user: User):
-    user_collection = get_user_collection()
-    print(f"DEBUG: Using user_collection: {user_collection.name}")
-    user_dict = user.dict(exclude={'id'})
-    print(f"DEBUG: Inserting user_dict: {user_dict}")
-    result = user_collection.insert_one(user_dict)
-    print(f"DEBUG: Inserted user with id: {result.inserted_id}")
-    return str(result.inserted_id)
+Endpoints use async_crud; this module only keeps what migrate_blobs.py and the
+benchmarks call, plus the projections both modules share.
+"""
+from database import get_upload_collection, get_blob_collection, Blob
+from blobstore import get_blob_store
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-def get_user_by_username(username: str):
-    user_collection = get_user_collection()
-    return user_collection.find_one({"username": username})
+# Upload CRUD
+def get_latest_upload_by_user_id(user_id: str):
+    upload_collection = get_upload_collection()
+    return upload_collection.find_one({"user_id": user_id}, sort=[("_id", -1)])
 
-def get_user_by_email(email: str):
-    user_collection = get_user_collection()
-    return user_collection.find_one({"email": email})
+# Projected upload reads. Upload documents carry encrypted text (and, for legacy
+# uploads, the encrypted files themselves); hot paths fetch only what they use.
+UPLOAD_FILE_FIELDS = ("resume", "job_description")
+UPLOAD_META_PROJECTION = {
+    field: 0
+    for name in UPLOAD_FILE_FIELDS
+    for field in (name, f"{name}_text")
+} | {"generated_questions": 0, "streamed_questions": 0, "context_summary": 0}
+UPLOAD_QUESTIONS_PROJECTION = {
+    "generated_questions": 1,
+    "streamed_questions": 1,
+    "questions_attempts": 1,
+    "questions_status": 1,
+    "questions_error": 1,
+    "questions_failed_at": 1,
+    "questions_lease": 1,
+    "experience": 1,
+    "yearsOfExperience": 1,
+    "resume_sha256": 1,
+    "job_description_sha256": 1,
+    "resume_text_sha256": 1,
+    "job_description_text_sha256": 1,
+}
 
-# Upload CRUD
-def create_upload(upload: Upload):
+def _upload_text_projection(fields) -> dict:
+    projection = {}
+    for field in fields:
+        projection[f"{field}_text"] = 1
+        projection[f"{field}_text_sha256"] = 1
+        projection[f"{field}_sha256"] = 1
+        projection[f"filename_{field}"] = 1
+    projection["context_summary"] = 1
+    projection["context_summary_key"] = 1
+    projection["context_summary_lease"] = 1
+    projection["context_cache"] = 1
+    return projection
+
+def get_latest_upload_meta(user_id: str):
+    """Latest upload without any file, text or question payloads."""
     upload_collection = get_upload_collection()
-    print(f"DEBUG: Using upload_collection: {upload_collection.name}")
-    upload_dict = upload.dict(exclude={'id'})
-    print(f"DEBUG: Inserting upload_dict: {upload_dict}")
-    result = upload_collection.insert_one(upload_dict)
-    print(f"DEBUG: Inserted upload with id: {result.inserted_id}")
-    return str(result.inserted_id)
+    return upload_collection.find_one({"user_id": user_id}, projection=UPLOAD_META_PROJECTION, sort=[("_id", -1)])
 
-def get_latest_upload_by_user_id(user_id: str):
+def get_latest_upload_questions(user_id: str):
+    """Latest upload's cached questions plus the metadata needed to generate them."""
     upload_collection = get_upload_collection()
-    return upload_collection.find_one({"user_id": user_id}, sort=[("_id", -1)])
+    return upload_collection.find_one({"user_id": user_id}, projection=UPLOAD_QUESTIONS_PROJECTION, sort=[("_id", -1)])
 
-def update_upload_questions(upload_id: str, questions: List[str]):
+def get_latest_upload_text(user_id: str, fields=UPLOAD_FILE_FIELDS):
+    """Latest upload's encrypted extracted text for the given file fields."""
     upload_collection = get_upload_collection()
-    upload_collection.update_one({"_id": ObjectId(upload_id)}, {"$set": {"generated_questions": questions}})
+    return upload_collection.find_one({"user_id": user_id}, projection=_upload_text_projection(fields), sort=[("_id", -1)])
+
+# Blob CRUD
+# Blobs are content-addressed by the SHA-256 of the plaintext file and shared by
+# every upload of that file. refcount counts referencing uploads; a blob is only
+# ever deleted by a conditional delete on refcount <= 0, so a concurrent
+# acquire_blob either wins (and the delete matches nothing) or misses and
+# re-creates the blob. The file data itself lives in the blob store under a
+# data_key that is unique per write, so deleting a dead blob's data can never
+# remove the data of a blob re-created for the same content.
+def acquire_blob(sha256: str):
+    """Take a reference on an existing blob. Returns its metadata (without data), or None."""
+    blob_collection = get_blob_collection()
+    return blob_collection.find_one_and_update(
+        {"_id": sha256, "refcount": {"$gt": 0}},
+        {"$inc": {"refcount": 1}},
+        projection={"data": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+def create_blob(blob: Blob):
+    """Insert a new blob holding one reference. Returns False if it already existed.
+
+    The blob's data must already be in the blob store under ``blob.data_key``;
+    if an identical blob won the race, that data is deleted again.
+    """
+    blob_collection = get_blob_collection()
+    blob_dict = blob.dict(by_alias=True, exclude={"data"})
+    blob_dict["refcount"] = 1
+    while True:
+        try:
+            blob_collection.insert_one(blob_dict)
+            return True
+        except DuplicateKeyError:
+            # Lost a race with an identical upload: reference the winner's copy,
+            # or take over a dead blob that was released but not yet deleted.
+            if acquire_blob(blob.id) is not None:
+                get_blob_store().delete(blob.data_key)
+                return False
+            dead_blob = blob_collection.find_one_and_replace(
+                {"_id": blob.id, "refcount": {"$lte": 0}},
+                blob_dict,
+                projection={"data_key": 1},
+            )
+            if dead_blob is not None:
+                _delete_blob_data(dead_blob)
+                return True
 
-# Feedback CRUD
-def create_feedback(feedback: Feedback):
-    feedback_collection = get_feedback_collection()
-    print(f"DEBUG: Using feedback_collection: {feedback_collection.name}")
-    feedback_dict = feedback.dict(exclude={'id'})
-    print(f"DEBUG: Inserting feedback_dict: {feedback_dict}")
-    result = feedback_collection.insert_one(feedback_dict)
-    print(f"DEBUG: Inserted feedback with id: {result.inserted_id}")
-    return str(result.inserted_id)
+def _delete_blob_data(blob: dict):
+    if blob.get("data_key"):
+        get_blob_store().delete(blob["data_key"])
 
-# Analysis Feedback CRUD
-def create_analysis_feedback(feedback: AnalysisFeedback):
-    feedback_collection = get_analysis_feedback_collection()
-    feedback_dict = feedback.dict(exclude={'id'})
-    result = feedback_collection.insert_one(feedback_dict)
-    return str(result.inserted_id)
+def release_blob(sha256: str):
+    blob_collection = get_blob_collection()
+    blob_collection.update_one({"_id": sha256}, {"$inc": {"refcount": -1}})
+    dead_blob = blob_collection.find_one_and_delete(
+        {"_id": sha256, "refcount": {"$lte": 0}},
+        projection={"data_key": 1},
+    )
+    if dead_blob is not None:
+        _delete_blob_data(dead_blob)
 
-def get_analysis_feedback_by_user_id(user_id: str):
-    feedback_collection = get_analysis_feedback_collection()
-    return list(feedback_collection.find({"user_id": user_id}))
+def collect_garbage_blobs() -> int:
+    """Delete unreferenced blobs left behind by interrupted releases."""
+    blob_collection = get_blob_collection()
+    deleted = 0
+    while True:
+        dead_blob = blob_collection.find_one_and_delete({"refcount": {"$lte": 0}}, projection={"data_key": 1})
+        if dead_blob is None:
+            return deleted
+        _delete_blob_data(dead_blob)
+        deleted += 1
@@ -1,8 +1,10 @@
 import os
 from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field
 from bson import ObjectId
 from typing import Optional, List
+from datetime import datetime
 from dotenv import load_dotenv
 
 from pymongo.errors import ConnectionFailure
@@ -13,18 +15,57 @@ from pymongo import uri_parser
 # The connection string should be in the format: mongodb+srv://<username>:<password>@<cluster-url>/<database-name>?retryWrites=true&w=majority
 load_dotenv()
 MONGO_URI = os.environ.get("MONGO_URI")
-if not MONGO_URI:
-    raise ValueError("MONGO_URI environment variable not set. Please create a .env file and add your MongoDB connection string.")
-
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    # The ismaster command is cheap and does not require auth.
-    client.admin.command('ismaster')
-    print("MongoDB connected successfully!")
+
+# Clients are created by connect(), not at import time: the application calls it
+# from its lifespan handler in each worker process (after any fork), and scripts
+# get a lazy connection on first use through get_db() / get_async_db().
+client = None
+db = None
+# Motor client for the async repository layer (async_crud.py). It shares the
+# server and database with the blocking client, and binds to the running
+# event loop on first use.
+async_client = None
+async_db = None
+
+
+def connect():
+    global client, db, async_client, async_db
+    if client is not None:
+        return
+    if not MONGO_URI:
+        raise ValueError("MONGO_URI environment variable not set. Please create a .env file and add your MongoDB connection string.")
+    try:
+        new_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        # The ismaster command is cheap and does not require auth.
+        new_client.admin.command('ismaster')
+        print("MongoDB connected successfully!")
+    except ConnectionFailure:
+        raise ConnectionFailure("Could not connect to MongoDB. Please check your MONGO_URI.")
     db_name = uri_parser.parse_uri(MONGO_URI)['database']
-    db = client[db_name]
-except ConnectionFailure:
-    raise ConnectionFailure("Could not connect to MongoDB. Please check your MONGO_URI.")
+    client, db = new_client, new_client[db_name]
+    async_client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    async_db = async_client[db_name]
+
+
+def close():
+    global client, db, async_client, async_db
+    if async_client is not None:
+        async_client.close()
+    if client is not None:
+        client.close()
+    client = db = async_client = async_db = None
+
+
+def get_db():
+    if db is None:
+        connect()
+    return db
+
+
+def get_async_db():
+    if async_db is None:
+        connect()
+    return async_db
 
 # Helper to convert ObjectId to string
 def PyObjectId(v: any) -> ObjectId:
@@ -42,16 +83,90 @@ class User(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+class Session(BaseModel):
+    # One document per refresh token issued. Rotating a token marks it used
+    # and inserts its successor with the same family_id.
+    id: Optional[str] = Field(alias='_id', default=None)
+    user_id: str
+    username: str
+    family_id: str
+    # SHA-256 of the refresh token; the token itself is never stored.
+    token_hash: str
+    created_at: datetime
+    # Removed by the TTL index once past.
+    expires_at: datetime
+    rotated_at: Optional[datetime] = None
+    revoked: bool = False
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+class Blob(BaseModel):
+    # Content-addressed: the id is the SHA-256 of the plaintext file.
+    id: str = Field(alias='_id')
+    # Key of the encrypted file data in the blob store (see blobstore.py).
+    # Blobs written before the blob store existed hold the data inline instead.
+    data_key: Optional[str] = None
+    data: Optional[bytes] = None
+    size: int
+    content_type: Optional[str] = None
+    refcount: int = 1
+    # Derived artifacts, shared by every upload of the same file.
+    text: Optional[bytes] = None
+    text_sha256: Optional[str] = None
+    text_truncated: bool = False
+    # The content type the text was extracted as. The same bytes uploaded under
+    # another type may yield different text (e.g. nothing at all for a PDF sent
+    # as application/octet-stream).
+    text_content_type: Optional[str] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
 class Upload(BaseModel):
     id: Optional[str] = Field(alias='_id', default=None)
     user_id: str
-    resume: bytes
-    job_description: bytes
+    # Legacy uploads stored the encrypted files inline; new uploads reference
+    # documents in the blobs collection by their SHA-256.
+    resume: Optional[bytes] = None
+    job_description: Optional[bytes] = None
+    resume_sha256: Optional[str] = None
+    job_description_sha256: Optional[str] = None
+    # Normalized text extracted at upload time, encrypted like the files themselves.
+    resume_text: Optional[bytes] = None
+    job_description_text: Optional[bytes] = None
+    resume_text_sha256: Optional[str] = None
+    job_description_text_sha256: Optional[str] = None
+    # Set when extraction stopped at the page or character budget.
+    resume_text_truncated: bool = False
+    job_description_text_truncated: bool = False
     filename_resume: str
     filename_job_description: str
     experience: str
     yearsOfExperience: Optional[str] = None
     generated_questions: Optional[List[str]] = None
+    # Background generation: "pending", "generating", "ready" or "failed".
+    questions_status: Optional[str] = None
+    questions_error: Optional[str] = None
+    # When the last generation failed; polls wait before retrying it.
+    questions_failed_at: Optional[datetime] = None
+    # {"owner", "expires_at"} while one worker generates the questions.
+    questions_lease: Optional[dict] = None
+    # Questions of the running generation so far, in the order they were
+    # generated, for /api/questions/stream; and the number of generations started.
+    streamed_questions: Optional[List[str]] = None
+    questions_attempts: int = 0
+    # Condensed job requirements and candidate profile used in analysis prompts,
+    # encrypted; the key says which texts and summary prompt produced it.
+    context_summary: Optional[bytes] = None
+    context_summary_key: Optional[str] = None
+    # {"owner", "expires_at"} while one worker generates the summary.
+    context_summary_lease: Optional[dict] = None
+    # {"backend", "name", "key", "expires_at"} of the provider-side cached
+    # analysis context (see context_cache.py).
+    context_cache: Optional[dict] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -78,13 +193,44 @@ class AnalysisFeedback(BaseModel):
         json_encoders = {ObjectId: str}
 
 def get_user_collection():
-    return db.get_collection("users")
+    return get_db().get_collection("users")
 
 def get_upload_collection():
-    return db.get_collection("uploads")
+    return get_db().get_collection("uploads")
+
+def get_blob_collection():
+    return get_db().get_collection("blobs")
+
+def get_session_collection():
+    return get_db().get_collection("sessions")
 
 def get_feedback_collection():
-    return db.get_collection("feedback")
+    return get_db().get_collection("feedback")
 
 def get_analysis_feedback_collection():
-    return db.get_collection("analysis_feedback")
+    return get_db().get_collection("analysis_feedback")
+
+def get_analysis_cache_collection():
+    return get_db().get_collection("analysis_cache")
+
+# Async (Motor) collections
+def get_async_user_collection():
+    return get_async_db().get_collection("users")
+
+def get_async_upload_collection():
+    return get_async_db().get_collection("uploads")
+
+def get_async_blob_collection():
+    return get_async_db().get_collection("blobs")
+
+def get_async_session_collection():
+    return get_async_db().get_collection("sessions")
+
+def get_async_feedback_collection():
+    return get_async_db().get_collection("feedback")
+
+def get_async_analysis_feedback_collection():
+    return get_async_db().get_collection("analysis_feedback")
+
+def get_async_analysis_cache_collection():
+    return get_async_db().get_collection("analysis_cache")
@@ -0,0 +1,57 @@
+import os
+import struct
+from typing import BinaryIO, Iterator
+
+from cryptography.fernet import Fernet
+
+# Generate a key for encryption.
+# In a production environment, this key should be stored securely, for example, in an environment variable.
+# You can generate a key using: from cryptography.fernet import Fernet; Fernet.generate_key()
+ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY", "your-32-byte-long-url-safe-base64-encoded-encryption-key").encode()
+cipher_suite = Fernet(ENCRYPTION_KEY)
+
+# Fernet can only encrypt a whole message at once, so large files are encrypted
+# as a sequence of independent Fernet tokens ("frames"). A framed blob starts with
+# FRAMED_MAGIC followed by <4-byte big-endian length><token> records. Legacy blobs
+# are a single bare Fernet token, which always starts with "gAAAAA".
+FRAMED_MAGIC = b"FRAMED1\n"
+_FRAME_HEADER = struct.Struct(">I")
+
+
+def encrypt_file(data: bytes) -> bytes:
+    return cipher_suite.encrypt(data)
+
+
+def decrypt_file(data: bytes) -> bytes:
+    if data.startswith(FRAMED_MAGIC):
+        return b"".join(_iter_frames(memoryview(data)[len(FRAMED_MAGIC):]))
+    return cipher_suite.decrypt(data)
+
+
+def encrypt_frame(chunk: bytes) -> bytes:
+    token = cipher_suite.encrypt(chunk)
+    return _FRAME_HEADER.pack(len(token)) + token
+
+
+def _iter_frames(view: memoryview) -> Iterator[bytes]:
+    offset = 0
+    while offset < len(view):
+        (length,) = _FRAME_HEADER.unpack_from(view, offset)
+        offset += _FRAME_HEADER.size
+        yield cipher_suite.decrypt(bytes(view[offset:offset + length]))
+        offset += length
+
+
+def iter_decrypted(fileobj: BinaryIO) -> Iterator[bytes]:
+    """Decrypt a framed blob from a file-like object one frame at a time."""
+    magic = fileobj.read(len(FRAMED_MAGIC))
+    if magic != FRAMED_MAGIC:
+        # Legacy single-token blob: there is nothing to stream.
+        yield cipher_suite.decrypt(magic + fileobj.read())
+        return
+    while True:
+        header = fileobj.read(_FRAME_HEADER.size)
+        if not header:
+            return
+        (length,) = _FRAME_HEADER.unpack(header)
+        yield cipher_suite.decrypt(fileobj.read(length))
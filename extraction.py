@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import docx
+import pypdf
+from fastapi import HTTPException, status
+
+import metrics
+from encryption import iter_decrypted
+from pool_load import PoolLoad
+
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_CONTENT_TYPE = "text/plain"
+
+_CONTENT_TYPES_BY_EXTENSION = {
+    ".pdf": PDF_CONTENT_TYPE,
+    ".docx": DOCX_CONTENT_TYPE,
+    ".txt": TEXT_CONTENT_TYPE,
+}
+
+# Everything extracted ends up in every Gemini prompt for the upload, so there is
+# no point parsing a 200-page "resume" in full. Extraction stops once either
+# budget is exhausted and the result is marked as truncated.
+EXTRACTION_MAX_PAGES = int(os.environ.get("EXTRACTION_MAX_PAGES", 30))
+EXTRACTION_MAX_CHARS = int(os.environ.get("EXTRACTION_MAX_CHARS", 60000))
+
+
+class ExtractedText(NamedTuple):
+    text: str
+    pages: int
+    truncated: bool
+
+
+# Helper: Iterate over the text of each page of a PDF
+def iter_pdf_pages(file, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    pages = pypdf.PdfReader(file).pages
+    for i in range(start, len(pages) if stop is None else min(stop, len(pages))):
+        yield pages[i].extract_text()
+
+
+# Helper: Iterate over the paragraphs of a DOCX
+def iter_docx_paragraphs(file) -> Iterator[str]:
+    for para in docx.Document(file).paragraphs:
+        yield para.text + "\n"
+
+
+def collect_text(pieces: Iterable[str], max_chars: Optional[int] = None) -> ExtractedText:
+    """Join pieces of text until the character budget is exhausted.
+
+    Pieces are gathered into a list and joined once, and the source iterator is
+    not advanced past the budget, so unread pages are never parsed.
+    """
+    parts = []
+    chars = 0
+    count = 0
+    for piece in pieces:
+        if max_chars is not None and chars + len(piece) > max_chars:
+            parts.append(piece[:max_chars - chars])
+            return ExtractedText("".join(parts), count + 1, True)
+        parts.append(piece)
+        chars += len(piece)
+        count += 1
+    return ExtractedText("".join(parts), count, False)
+
+
+def _collect(file, content_type: str, max_pages: Optional[int], max_chars: Optional[int]) -> ExtractedText:
+    if content_type == TEXT_CONTENT_TYPE:
+        return extract_text_from_plain(file, max_chars)
+    if content_type == PDF_CONTENT_TYPE:
+        page_count = len(pypdf.PdfReader(file).pages)
+        stop = page_count if max_pages is None else min(max_pages, page_count)
+        result = collect_text(iter_pdf_pages(file, 0, stop), max_chars=max_chars)
+        return result._replace(truncated=result.truncated or stop < page_count)
+    if content_type == DOCX_CONTENT_TYPE:
+        # A DOCX has no reliable page count; report it as a single page.
+        return collect_text(iter_docx_paragraphs(file), max_chars=max_chars)._replace(pages=1)
+    return ExtractedText("", 0, False)
+
+
+# Helper: Extract text from PDF
+def extract_text_from_pdf(file, max_pages: Optional[int] = EXTRACTION_MAX_PAGES, max_chars: Optional[int] = EXTRACTION_MAX_CHARS) -> ExtractedText:
+    try:
+        return _collect(file, PDF_CONTENT_TYPE, max_pages, max_chars)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to extract text from PDF: {str(e)}")
+
+
+# Helper: Extract text from DOCX
+def extract_text_from_docx(file, max_chars: Optional[int] = EXTRACTION_MAX_CHARS) -> ExtractedText:
+    try:
+        return _collect(file, DOCX_CONTENT_TYPE, None, max_chars)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to extract text from DOCX: {str(e)}")
+
+
+# Helper: Extract text from a plain-text file
+def extract_text_from_plain(file, max_chars: Optional[int] = EXTRACTION_MAX_CHARS) -> ExtractedText:
+    if max_chars is None:
+        return ExtractedText(file.read().decode("utf-8", errors="ignore"), 1, False)
+    # UTF-8 needs at most 4 bytes per character.
+    data = file.read(max_chars * 4 + 1)
+    text = data[:max_chars * 4].decode("utf-8", errors="ignore")
+    truncated = len(data) > max_chars * 4 or len(text) > max_chars
+    return ExtractedText(text[:max_chars], 1, truncated)
+
+
+def guess_content_type(filename: str) -> str:
+    return _CONTENT_TYPES_BY_EXTENSION.get(os.path.splitext(filename or "")[1].lower(), "")
+
+
+def extract_text(file, content_type: str) -> ExtractedText:
+    """Extract normalized plain text from an uploaded file of the given content type."""
+    if content_type == PDF_CONTENT_TYPE:
+        result = extract_text_from_pdf(file)
+    elif content_type == DOCX_CONTENT_TYPE:
+        result = extract_text_from_docx(file)
+    else:
+        result = _collect(file, content_type, EXTRACTION_MAX_PAGES, EXTRACTION_MAX_CHARS)
+    return result._replace(text=normalize_text(result.text))
+
+
+def extract_text_from_bytes(data: bytes, content_type: str) -> ExtractedText:
+    return extract_text(io.BytesIO(data), content_type)
+
+
+_HORIZONTAL_WHITESPACE = re.compile(r"[ \t\f\v\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse the whitespace noise PDF/DOCX extraction leaves behind."""
+    text = text.replace("\x00", "").replace("\r\n", "\n").replace("\r", "\n")
+    text = "\n".join(_HORIZONTAL_WHITESPACE.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ===============================
+# Process-pool extraction engine
+# ===============================
+# pypdf and python-docx are pure-Python and CPU-bound: run in the request
+# handler they hold the GIL and a pathological PDF stalls the whole worker.
+# The engine runs them in a bounded process pool instead, with timeouts.
+
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+EXTRACTION_MAX_PENDING = int(os.environ.get("EXTRACTION_MAX_PENDING", 64))
+EXTRACTION_TIMEOUT_SECONDS = float(os.environ.get("EXTRACTION_TIMEOUT_SECONDS", 60))
+EXTRACTION_PAGE_TIMEOUT_SECONDS = float(os.environ.get("EXTRACTION_PAGE_TIMEOUT_SECONDS", 5))
+# PDFs with more pages than this are split into page ranges extracted in parallel.
+EXTRACTION_PAGES_PER_TASK = int(os.environ.get("EXTRACTION_PAGES_PER_TASK", 8))
+
+_FAILURE_LABELS = {
+    PDF_CONTENT_TYPE: "PDF",
+    DOCX_CONTENT_TYPE: "DOCX",
+    TEXT_CONTENT_TYPE: "text file",
+}
+
+
+def can_extract(content_type: str) -> bool:
+    return content_type in _FAILURE_LABELS
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+# Workers get the path of the encrypted spool file (see ingest.py) and decrypt
+# it into their own memory; extraction itself writes no plaintext to disk.
+def _open_spool(path: str) -> io.BytesIO:
+    with open(path, "rb") as file:
+        return io.BytesIO(b"".join(iter_decrypted(file)))
+
+
+def _count_pdf_pages(path: str) -> int:
+    return len(pypdf.PdfReader(_open_spool(path)).pages)
+
+
+def _extract_pdf_page_range(path: str, start: int, stop: int, max_chars: int) -> ExtractedText:
+    return collect_text(iter_pdf_pages(_open_spool(path), start, stop), max_chars=max_chars)
+
+
+def _extract_file(path: str, content_type: str, max_pages: int, max_chars: int) -> ExtractedText:
+    return _collect(_open_spool(path), content_type, max_pages, max_chars)
+
+
+class ExtractionEngine:
+    """Awaitable text extraction on a bounded ProcessPoolExecutor.
+
+    The pool is created lazily on first use, so it is never inherited across a
+    fork. A task that overruns its timeout cannot be interrupted inside the
+    worker, so the pool is torn down and replaced; tasks from other documents
+    that were running in it are retried once on the new pool.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = EXTRACTION_WORKERS,
+        max_pending: int = EXTRACTION_MAX_PENDING,
+        timeout: float = EXTRACTION_TIMEOUT_SECONDS,
+        page_timeout: float = EXTRACTION_PAGE_TIMEOUT_SECONDS,
+        pages_per_task: int = EXTRACTION_PAGES_PER_TASK,
+        max_pages: int = EXTRACTION_MAX_PAGES,
+        max_chars: int = EXTRACTION_MAX_CHARS,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.page_timeout = page_timeout
+        self.pages_per_task = pages_per_task
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+        self._pool = None
+        self._generation = 0
+        self._load = PoolLoad("extraction", "Pool tasks", max_workers)
+        self._latency = metrics.histogram("extraction_latency_seconds", "Wall time to extract one document")
+        self._documents = metrics.counter("extraction_documents_total", "Documents extracted")
+        self._timeouts = metrics.counter("extraction_timeouts_total", "Documents or pages that hit a timeout")
+        self._failures = metrics.counter("extraction_failures_total", "Documents that failed to extract")
+        self._truncated = metrics.counter("extraction_truncated_total", "Documents cut short by the page or character budget")
+        self._rejected = metrics.counter("extraction_rejected_total", "Documents rejected because the queue was full")
+        self._recycles = metrics.counter("extraction_pool_recycles_total", "Pools torn down after a timeout")
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork: the parent holds MongoClient and gRPC threads.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._generation += 1
+        return self._pool
+
+    def _recycle(self, generation: int):
+        if self._pool is None or generation != self._generation:
+            return  # Already replaced by another timed-out task.
+        pool, self._pool = self._pool, None
+        self._recycles.inc()
+        # ProcessPoolExecutor has no public way to stop a running task.
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, timeout: float, fn, *args, retry: bool = True):
+        pool = self._get_pool()
+        generation = self._generation
+        with self._load.task():
+            future = None
+            try:
+                future = pool.submit(fn, *args)
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                self._timeouts.inc()
+                self._recycle(generation)
+                raise
+            except asyncio.CancelledError:
+                # The document as a whole timed out or failed; do not leave a
+                # worker busy on a task nobody is waiting for.
+                if future is not None and not future.cancel() and not future.done():
+                    self._recycle(generation)
+                raise
+            except BrokenProcessPool:
+                # Our pool was recycled because another task timed out.
+                self._recycle(generation)
+                if not retry:
+                    raise
+        return await self._run(timeout, fn, *args, retry=False)
+
+    async def _extract_page_ranges(self, path: str, ranges, max_chars: int):
+        tasks = [
+            asyncio.ensure_future(
+                self._run(self.page_timeout * (stop - start), _extract_pdf_page_range, path, start, stop, max_chars)
+            )
+            for start, stop in ranges
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _extract_pdf(self, path: str) -> ExtractedText:
+        page_count = await self._run(self.page_timeout, _count_pdf_pages, path)
+        pages_to_read = min(page_count, self.max_pages)
+        ranges = [
+            (start, min(start + self.pages_per_task, pages_to_read))
+            for start in range(0, pages_to_read, self.pages_per_task)
+        ]
+        # Extract one window of max_workers ranges at a time so that a document
+        # that exhausts the character budget early stops being parsed.
+        results = []
+        remaining = self.max_chars
+        for i in range(0, len(ranges), self.max_workers):
+            window = await self._extract_page_ranges(path, ranges[i:i + self.max_workers], remaining)
+            results.extend(window)
+            remaining -= sum(len(result.text) for result in window)
+            if remaining <= 0 or any(result.truncated for result in window):
+                break
+        combined = collect_text((result.text for result in results), max_chars=self.max_chars)
+        pages = sum(result.pages for result in results)
+        truncated = combined.truncated or any(result.truncated for result in results) or pages < page_count
+        return ExtractedText(combined.text, pages, truncated)
+
+    async def extract(self, path: str, content_type: str) -> ExtractedText:
+        """Extract normalized text from the encrypted spool file at ``path`` without blocking the event loop."""
+        if content_type not in _FAILURE_LABELS:
+            return ExtractedText("", 0, False)
+        if self._load.in_flight >= self.max_pending:
+            self._rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Document extraction is overloaded, please retry shortly.",
+            )
+        label = _FAILURE_LABELS[content_type]
+        started = time.perf_counter()
+        try:
+            if content_type == PDF_CONTENT_TYPE:
+                result = await asyncio.wait_for(self._extract_pdf(path), self.timeout)
+            else:
+                result = await self._run(self.timeout, _extract_file, path, content_type, self.max_pages, self.max_chars)
+        except asyncio.TimeoutError:
+            self._failures.inc()
+            raise HTTPException(
+                status_code=422,
+                detail=f"Timed out extracting text from {label}.",
+            )
+        except Exception as e:
+            self._failures.inc()
+            raise HTTPException(status_code=500, detail=f"Failed to extract text from {label}: {str(e)}")
+        finally:
+            self._latency.observe(time.perf_counter() - started)
+        self._documents.inc()
+        if result.truncated:
+            self._truncated.inc()
+        return result._replace(text=normalize_text(result.text))
+
+    async def warm_up(self):
+        """Start every worker process now rather than on the first upload."""
+        pool = self._get_pool()
+        await asyncio.gather(*(asyncio.wrap_future(pool.submit(_ping)) for _ in range(self.max_workers)))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+engine = ExtractionEngine()
@@ -0,0 +1,80 @@
+"""Password hashing on a dedicated, size-limited thread pool.
+
+bcrypt is deliberately slow (~250 ms at cost 12). Run on the shared AnyIO
+threadpool, a burst of logins occupies every thread and stalls all other
+endpoints' blocking work behind it. Hashes here run on their own
+HASHING_WORKERS threads instead (bcrypt releases the GIL), at most
+HASHING_MAX_PENDING hashes may wait for one, and past that login and register
+answer 503 rather than queueing without bound.
+
+BCRYPT_ROUNDS sets the cost of new hashes. Stored hashes with any other cost,
+or a deprecated scheme, are replaced on the user's next successful login.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+import metrics
+from pool_load import PoolLoad
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+HASHING_WORKERS = int(os.environ.get("HASHING_WORKERS", min(4, os.cpu_count() or 1)))
+HASHING_MAX_PENDING = int(os.environ.get("HASHING_MAX_PENDING", 64))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HashingPool:
+    def __init__(self, max_workers: int = HASHING_WORKERS, max_pending: int = HASHING_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._load = PoolLoad("hashing", "Password hashes", max_workers)
+        self._wait = metrics.histogram("hashing_queue_wait_seconds", "Time a password hash waited for a hashing thread")
+        self._latency = metrics.histogram("hashing_latency_seconds", "Time to compute one password hash")
+        self._rejected = metrics.counter("hashing_rejected_total", "Password hashes rejected because the queue was full")
+        self._rehashed = metrics.counter("hashing_rehashed_total", "Stored password hashes upgraded on login")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hashing")
+        return self._executor
+
+    def _timed(self, submitted: float, fn, *args):
+        started = time.perf_counter()
+        self._wait.observe(started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            self._latency.observe(time.perf_counter() - started)
+
+    async def _run(self, fn, *args):
+        if self._load.in_flight >= self.max_workers + self.max_pending:
+            self._rejected.inc()
+            raise HTTPException(status_code=503, detail="Too many sign-in requests right now, please retry shortly.")
+        with self._load.task():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), self._timed, time.perf_counter(), fn, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Check ``password``; also return a replacement hash if the stored one is outdated."""
+        verified, new_hash = await self._run(pwd_context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self._rehashed.inc()
+        return verified, new_hash
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pool = HashingPool()
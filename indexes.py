@@ -0,0 +1,133 @@
+"""Index bootstrap and index-usage verification for every collection.
+
+ensure_indexes() runs at application startup. The check mode replays the shape
+of each crud query through explain() and fails if any of them would scan a
+whole collection:
+
+    python indexes.py           # create missing indexes
+    python indexes.py --check   # create, then verify; exits 1 on any COLLSCAN
+"""
+import sys
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from database import get_db
+
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "uploads": [
+        # get_latest_upload_*: filter user_id, sort _id desc.
+        IndexModel([("user_id", ASCENDING), ("_id", DESCENDING)], name="user_id_latest"),
+        # find_generated_questions: reuse questions across identical files.
+        IndexModel(
+            [
+                ("resume_sha256", ASCENDING),
+                ("job_description_sha256", ASCENDING),
+                ("experience", ASCENDING),
+                ("yearsOfExperience", ASCENDING),
+            ],
+            name="content_questions",
+        ),
+    ],
+    "sessions": [
+        IndexModel([("token_hash", ASCENDING)], unique=True, name="token_hash_unique"),
+        # Reuse of a rotated token revokes its whole family.
+        IndexModel([("family_id", ASCENDING)], name="family_id"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "analysis_feedback": [
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_id"),
+    ],
+    "analysis_cache": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "blobs": [
+        # collect_garbage_blobs.
+        IndexModel([("refcount", ASCENDING)], name="refcount"),
+    ],
+}
+
+# (description, collection, filter, sort) for every query crud.py and async_crud.py issue.
+_SAMPLE_ID = ObjectId()
+CHECKED_QUERIES = [
+    ("get_user_by_username", "users", {"username": "x"}, None),
+    ("get_user_by_email", "users", {"email": "x"}, None),
+    ("get_latest_upload_*", "uploads", {"user_id": "x"}, [("_id", DESCENDING)]),
+    ("upload by id", "uploads", {"_id": _SAMPLE_ID}, None),
+    (
+        "find_generated_questions",
+        "uploads",
+        {
+            "resume_sha256": "x",
+            "job_description_sha256": "x",
+            "resume_text_sha256": "x",
+            "job_description_text_sha256": "x",
+            "experience": "x",
+            "yearsOfExperience": "x",
+            "generated_questions": {"$ne": None},
+        },
+        None,
+    ),
+    ("rotate_session", "sessions", {"token_hash": "x", "rotated_at": None, "revoked": False}, None),
+    ("revoke_session_family", "sessions", {"family_id": "x"}, None),
+    ("revoke_user_sessions", "sessions", {"user_id": "x"}, None),
+    ("get_analysis_feedback_by_user_id", "analysis_feedback", {"user_id": "x"}, [("_id", ASCENDING)]),
+    ("get_cached_analysis", "analysis_cache", {"_id": "x", "expires_at": {"$gt": _SAMPLE_ID.generation_time}}, None),
+    ("blob by hash", "blobs", {"_id": "x"}, None),
+    ("collect_garbage_blobs", "blobs", {"refcount": {"$lte": 0}}, None),
+]
+
+
+def ensure_indexes(strict: bool = False):
+    """Create any missing indexes. Failures are logged unless ``strict``."""
+    for collection_name, indexes in INDEXES.items():
+        try:
+            get_db().get_collection(collection_name).create_indexes(indexes)
+        except OperationFailure as e:
+            # Typically a unique index over existing duplicate users; the
+            # service still works, just without the index.
+            if strict:
+                raise
+            print(f"WARNING: could not create indexes on {collection_name}: {e}")
+    print("MongoDB indexes ensured.")
+
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def check_indexes() -> list:
+    """Return the descriptions of all crud queries whose winning plan is a COLLSCAN."""
+    failures = []
+    for description, collection_name, query, sort in CHECKED_QUERIES:
+        cursor = get_db().get_collection(collection_name).find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        # Newer servers wrap the classic plan under queryPlan.
+        stages = list(_plan_stages(winning_plan.get("queryPlan", winning_plan)))
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        print(f"{status:>8}  {collection_name}.{description}: {' <- '.join(filter(None, stages))}")
+        if status == "COLLSCAN":
+            failures.append(f"{collection_name}.{description}")
+    return failures
+
+
+if __name__ == "__main__":
+    ensure_indexes(strict=True)
+    if "--check" in sys.argv[1:]:
+        failures = check_indexes()
+        if failures:
+            print(f"Collection scans in: {', '.join(failures)}")
+            sys.exit(1)
+        print("All crud queries use an index.")
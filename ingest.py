@@ -0,0 +1,103 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+
+from encryption import FRAMED_MAGIC, encrypt_frame
+
+# Size of each read from a multipart part. At most one chunk per file is held in
+# memory; everything else lives in the spool file on disk.
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 256 * 1024))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+
+
+class SpooledUpload:
+    """An uploaded file that has been hashed and encrypted into a temp file."""
+
+    def __init__(self, spool: BinaryIO, sha256: str, size: int, encrypted_size: int):
+        self.spool = spool
+        self.sha256 = sha256
+        self.size = size
+        self.encrypted_size = encrypted_size
+
+    @property
+    def path(self) -> str:
+        """Path of the encrypted spool file, for processes that open it themselves."""
+        return self.spool.name
+
+    def open_encrypted(self) -> BinaryIO:
+        """Rewind and return the encrypted spool file for streaming it elsewhere."""
+        self.spool.seek(0)
+        return self.spool
+
+    def close(self):
+        self.spool.close()
+
+
+def check_content_length(content_length: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """Reject a request before its body is parsed when it is clearly too large.
+
+    Starlette reads the whole multipart body before spool_upload sees a byte,
+    so the declared length is the only early bound: a request without one
+    (e.g. chunked) is refused rather than read in full first.
+    """
+    if not content_length.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_411_LENGTH_REQUIRED,
+            detail="Uploads must declare a Content-Length.",
+        )
+    # Two files plus multipart framing and form fields.
+    if int(content_length) > 2 * max_bytes + 64 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload exceeds the maximum size of {max_bytes} bytes per file.",
+        )
+
+
+def _spool_chunk(spool: BinaryIO, digest, chunk: bytes):
+    digest.update(chunk)
+    spool.write(encrypt_frame(chunk))
+
+
+async def spool_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """Stream an UploadFile into an encrypted spool file in bounded chunks.
+
+    The plaintext is hashed and encrypted chunk by chunk in the threadpool, so
+    memory use is bounded by UPLOAD_CHUNK_SIZE regardless of the file size and
+    the event loop is not blocked. Raises 413 as soon as more than ``max_bytes``
+    have been read. The spool file has a path (see SpooledUpload.path) and is
+    removed by ``close()``.
+
+    Starlette's multipart parser has already buffered the part by then, in a
+    plaintext temporary file once it is over 1 MB; that file is removed when
+    the request ends. Everything this app keeps or hands to other processes is
+    the encrypted spool.
+    """
+    digest = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(prefix="upload-")
+    size = 0
+    try:
+        spool.write(FRAMED_MAGIC)
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"{upload.filename} exceeds the maximum size of {max_bytes} bytes.",
+                )
+            await run_in_threadpool(_spool_chunk, spool, digest, chunk)
+        encrypted_size = spool.tell()
+        # Other processes read it by path.
+        spool.flush()
+    except BaseException:
+        spool.close()
+        raise
+    # Leave the upload rewound for anything else that wants to read it.
+    await upload.seek(0)
+    return SpooledUpload(spool, digest.hexdigest(), size, encrypted_size)
@@ -0,0 +1,99 @@
+"""Interchangeable JWT libraries behind one small interface.
+
+auth.py signs and verifies tokens through get_jwt_backend(), selected with
+JWT_BACKEND:
+
+* ``jose`` (default) - python-jose, already a dependency;
+* ``pyjwt`` - PyJWT, optional (``pip install pyjwt``).
+
+Both produce and accept the same standard HS256 tokens, so switching backends
+does not invalidate tokens that are already issued.
+"""
+import os
+from typing import Optional
+
+JWT_BACKEND = os.environ.get("JWT_BACKEND", "jose")
+
+
+class InvalidTokenError(Exception):
+    """Raised for any token that is malformed, badly signed or expired."""
+
+
+class JWTBackend:
+    name = ""
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        raise NotImplementedError
+
+    def decode(self, token: str, key: str, algorithms: list) -> dict:
+        """Verify the signature and expiry of ``token`` and return its claims."""
+        raise NotImplementedError
+
+
+class JoseBackend(JWTBackend):
+    name = "jose"
+
+    def __init__(self):
+        from jose import JWTError, jwt
+        self._jwt = jwt
+        self._error = JWTError
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithms: list) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms)
+        except self._error as e:
+            raise InvalidTokenError(str(e)) from e
+
+
+class PyJWTBackend(JWTBackend):
+    name = "pyjwt"
+
+    def __init__(self):
+        import jwt
+        if not hasattr(jwt, "PyJWTError"):
+            # python-jose does not ship a top-level ``jwt`` module, but other
+            # unrelated packages do.
+            raise ImportError("The installed 'jwt' module is not PyJWT.")
+        self._jwt = jwt
+        self._error = jwt.PyJWTError
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithms: list) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms)
+        except self._error as e:
+            raise InvalidTokenError(str(e)) from e
+
+
+BACKENDS = {
+    JoseBackend.name: JoseBackend,
+    PyJWTBackend.name: PyJWTBackend,
+}
+
+
+def available_backends() -> dict:
+    """Instances of every backend whose library is installed, by name."""
+    backends = {}
+    for name, backend_class in BACKENDS.items():
+        try:
+            backends[name] = backend_class()
+        except ImportError:
+            pass
+    return backends
+
+
+_jwt_backend: Optional[JWTBackend] = None
+
+
+def get_jwt_backend() -> JWTBackend:
+    global _jwt_backend
+    if _jwt_backend is None:
+        if JWT_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown JWT_BACKEND {JWT_BACKEND!r}; expected one of {', '.join(BACKENDS)}.")
+        _jwt_backend = BACKENDS[JWT_BACKEND]()
+    return _jwt_backend
@@ -0,0 +1,317 @@
+"""Async gateway for every Gemini call the API makes.
+
+Calls go through the async Gemini client, so a multi-second generation holds
+no thread at all, only a coroutine. Concurrency is limited instead by
+semaphores: LLM_MAX_CONCURRENCY across all models per worker, and
+LLM_MODEL_CONCURRENCY per model (``name=limit`` pairs, comma separated; models
+not listed get LLM_DEFAULT_MODEL_CONCURRENCY). A call that cannot get a slot
+within LLM_QUEUE_TIMEOUT_SECONDS fails with 503, and a generation that runs
+past its purpose's timeout (LLM_TIMEOUT_SECONDS by default) fails with 504.
+
+When the caller passes the request, the generation is cancelled as soon as the
+client disconnects, so abandoned requests stop holding slots.
+
+Each call names a purpose ("questions", "analysis", "summary"). PURPOSES holds every
+purpose's model, generation limits and timeout; any value can be overridden
+with LLM_<PURPOSE>_MODEL, _MAX_OUTPUT_TOKENS, _TEMPERATURE or _TIMEOUT_SECONDS.
+Configured model clients are built once per purpose and reused.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
+import google.generativeai as genai
+from fastapi import HTTPException, Request
+
+import metrics
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-pro-latest")
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 256))
+LLM_DEFAULT_MODEL_CONCURRENCY = int(os.environ.get("LLM_DEFAULT_MODEL_CONCURRENCY", 128))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 120))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", 30))
+LLM_DISCONNECT_POLL_SECONDS = 0.5
+
+
+def _parse_model_limits(value: str) -> Dict[str, int]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = item.partition("=")
+        limits[name.strip()] = int(limit)
+    return limits
+
+
+LLM_MODEL_CONCURRENCY = _parse_model_limits(os.environ.get("LLM_MODEL_CONCURRENCY", ""))
+
+
+class Purpose(NamedTuple):
+    model: str
+    # Thinking models count their reasoning against this cap too, so it is
+    # set well above the length of the visible answer.
+    max_output_tokens: int
+    temperature: float
+    timeout: float
+
+
+_DEFAULT_PURPOSES = {
+    # Twenty or so one-line questions; some variety between runs is wanted.
+    "questions": Purpose(GEMINI_MODEL, 4096, 0.9, LLM_TIMEOUT_SECONDS),
+    # A score and a few bullet points; keep grading consistent.
+    "analysis": Purpose(GEMINI_MODEL, 4096, 0.3, LLM_TIMEOUT_SECONDS),
+    # Condensed resume and job description (see context_summary.py); stick to the source.
+    "summary": Purpose(GEMINI_MODEL, 4096, 0.2, LLM_TIMEOUT_SECONDS),
+}
+
+
+def _purpose_from_env(name: str, default: Purpose) -> Purpose:
+    prefix = f"LLM_{name.upper()}_"
+    return Purpose(
+        model=os.environ.get(prefix + "MODEL", default.model),
+        max_output_tokens=int(os.environ.get(prefix + "MAX_OUTPUT_TOKENS", default.max_output_tokens)),
+        temperature=float(os.environ.get(prefix + "TEMPERATURE", default.temperature)),
+        timeout=float(os.environ.get(prefix + "TIMEOUT_SECONDS", default.timeout)),
+    )
+
+
+PURPOSES: Dict[str, Purpose] = {name: _purpose_from_env(name, default) for name, default in _DEFAULT_PURPOSES.items()}
+
+
+# Gemini averages about four characters of English text per token. Good
+# enough for logs and budgets; the exact count needs an API call.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class ClientDisconnected(HTTPException):
+    """The client went away while its generation was running."""
+
+    def __init__(self):
+        # 499 is the de-facto "client closed request" status; nobody reads it.
+        super().__init__(status_code=499, detail="Client closed request.")
+
+
+OUTPUT_TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+PROMPT_TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+
+class ModelRegistry:
+    """Configured GenerativeModel clients and usage stats, one set per purpose."""
+
+    def __init__(self, purposes: Dict[str, Purpose] = PURPOSES):
+        self.purposes = purposes
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._stats = {}
+        self._prompt_sizes: Dict[str, metrics.Histogram] = {}
+
+    def purpose(self, name: str) -> Purpose:
+        if name not in self.purposes:
+            raise ValueError(f"Unknown LLM purpose {name!r}; expected one of {', '.join(self.purposes)}.")
+        return self.purposes[name]
+
+    def generation_config(self, name: str) -> genai.GenerationConfig:
+        purpose = self.purpose(name)
+        return genai.GenerationConfig(max_output_tokens=purpose.max_output_tokens, temperature=purpose.temperature)
+
+    def model(self, name: str) -> genai.GenerativeModel:
+        if name not in self._models:
+            self._models[name] = genai.GenerativeModel(self.purpose(name).model, generation_config=self.generation_config(name))
+        return self._models[name]
+
+    def record_prompt(self, name: str, prompt: str):
+        """Record the estimated size of a prompt about to be sent for ``name``."""
+        if name not in self._prompt_sizes:
+            self._prompt_sizes[name] = metrics.histogram(
+                f"llm_{name}_prompt_tokens", f"Estimated tokens of one {name} prompt as sent", PROMPT_TOKEN_BUCKETS
+            )
+        self._prompt_sizes[name].observe(estimate_tokens(prompt))
+
+    def record(self, name: str, elapsed: float, response):
+        if name not in self._stats:
+            self._stats[name] = (
+                metrics.histogram(f"llm_{name}_latency_seconds", f"Wall time of one {name} generation"),
+                metrics.histogram(f"llm_{name}_output_tokens", f"Output tokens of one {name} generation", OUTPUT_TOKEN_BUCKETS),
+                metrics.counter(f"llm_{name}_max_tokens_total", f"{name} generations cut off at max_output_tokens"),
+            )
+        latency, output_tokens, max_tokens = self._stats[name]
+        latency.observe(elapsed)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            output_tokens.observe(usage.candidates_token_count)
+        candidates = getattr(response, "candidates", None)
+        if candidates and candidates[0].finish_reason.name == "MAX_TOKENS":
+            max_tokens.inc()
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        default_model_concurrency: int = LLM_DEFAULT_MODEL_CONCURRENCY,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = LLM_MODEL_CONCURRENCY if model_concurrency is None else model_concurrency
+        self.default_model_concurrency = default_model_concurrency
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._model_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.registry = ModelRegistry()
+        self._in_flight = metrics.gauge("llm_requests_in_flight", "Gemini generations running")
+        self._waiting = metrics.gauge("llm_requests_waiting", "Gemini generations waiting for a concurrency slot")
+        self._latency = metrics.histogram("llm_latency_seconds", "Wall time of one Gemini generation")
+        self._queue_wait = metrics.histogram("llm_queue_wait_seconds", "Time a generation waited for a concurrency slot")
+        self._timeouts = metrics.counter("llm_timeouts_total", "Gemini generations that hit their timeout")
+        self._rejected = metrics.counter("llm_rejected_total", "Gemini generations that never got a concurrency slot")
+        self._cancelled = metrics.counter("llm_cancelled_total", "Gemini generations cancelled because the client disconnected")
+        self._failures = metrics.counter("llm_failures_total", "Gemini generations that raised an error")
+
+    def _model_semaphore(self, model_name: str) -> asyncio.Semaphore:
+        if model_name not in self._model_semaphores:
+            limit = self.model_concurrency.get(model_name, self.default_model_concurrency)
+            self._model_semaphores[model_name] = asyncio.Semaphore(limit)
+        return self._model_semaphores[model_name]
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, deadline: float):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.perf_counter()))
+        except asyncio.TimeoutError:
+            self._rejected.inc()
+            raise HTTPException(status_code=503, detail="The AI service is busy right now, please retry shortly.")
+
+    async def _generate(self, purpose: str, prompt: str, model=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                (model or self.registry.model(purpose)).generate_content_async(prompt, **kwargs),
+                self.registry.purpose(purpose).timeout,
+            )
+            self.registry.record(purpose, time.perf_counter() - started, response)
+            return response
+        except asyncio.TimeoutError:
+            self._timeouts.inc()
+            raise HTTPException(status_code=504, detail="The AI service took too long to respond.")
+        except Exception:
+            self._failures.inc()
+            raise
+        finally:
+            self._latency.observe(time.perf_counter() - started)
+
+    @staticmethod
+    async def _wait_for_disconnect(request: Request):
+        while not await request.is_disconnected():
+            await asyncio.sleep(LLM_DISCONNECT_POLL_SECONDS)
+
+    @asynccontextmanager
+    async def _slot(self, model_name: str):
+        """Hold a global and a per-model concurrency slot."""
+        queued = time.perf_counter()
+        deadline = queued + self.queue_timeout
+        self._waiting.inc()
+        try:
+            await self._acquire(self._semaphore, deadline)
+            try:
+                await self._acquire(self._model_semaphore(model_name), deadline)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self._waiting.dec()
+        self._queue_wait.observe(time.perf_counter() - queued)
+        self._in_flight.inc()
+        try:
+            yield
+        finally:
+            self._in_flight.dec()
+            self._model_semaphore(model_name).release()
+            self._semaphore.release()
+
+    async def generate_content(self, prompt: str, purpose: str, request: Optional[Request] = None, model=None, **kwargs):
+        """Run one generation for ``purpose`` under the concurrency limits and return Gemini's response.
+
+        ``model`` replaces the purpose's shared client for this call, e.g. one
+        bound to cached content (see context_cache.py).
+        """
+        self.registry.record_prompt(purpose, prompt)
+        async with self._slot(self.registry.purpose(purpose).model):
+            if request is None:
+                return await self._generate(purpose, prompt, model=model, **kwargs)
+            generation = asyncio.ensure_future(self._generate(purpose, prompt, model=model, **kwargs))
+            disconnect = asyncio.ensure_future(self._wait_for_disconnect(request))
+            try:
+                done, _ = await asyncio.wait({generation, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                generation.cancel()
+                disconnect.cancel()
+                raise
+            disconnect.cancel()
+            if generation not in done:
+                generation.cancel()
+                self._cancelled.inc()
+                raise ClientDisconnected()
+            return generation.result()
+
+    async def stream_content(self, prompt: str, purpose: str, model=None, **kwargs) -> AsyncIterator[str]:
+        """Yield the text of Gemini's response for ``purpose`` chunk by chunk, as it is generated.
+
+        The slot is held until the stream ends or the consumer closes the
+        generator (StreamingResponse does when the client disconnects); closing
+        it also closes Gemini's stream, so the generation stops there.
+        """
+        self.registry.record_prompt(purpose, prompt)
+        async with self._slot(self.registry.purpose(purpose).model):
+            started = time.perf_counter()
+            deadline = started + self.registry.purpose(purpose).timeout
+            chunks = None
+            try:
+                response = await asyncio.wait_for(
+                    (model or self.registry.model(purpose)).generate_content_async(prompt, stream=True, **kwargs),
+                    deadline - time.perf_counter(),
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline - time.perf_counter())
+                    except StopAsyncIteration:
+                        break
+                    text = _chunk_text(chunk)
+                    if text:
+                        yield text
+            except asyncio.TimeoutError:
+                self._timeouts.inc()
+                raise HTTPException(status_code=504, detail="The AI service took too long to respond.")
+            except (asyncio.CancelledError, GeneratorExit):
+                self._cancelled.inc()
+                raise
+            except Exception:
+                self._failures.inc()
+                raise
+            finally:
+                if chunks is not None and hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                self._latency.observe(time.perf_counter() - started)
+            self.registry.record(purpose, time.perf_counter() - started, response)
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # A chunk with no text parts, e.g. only the finish reason or usage.
+        return ""
+
+
+gateway = LLMGateway()
+
+
+async def generate_content(prompt: str, purpose: str, request: Optional[Request] = None, model=None, **kwargs):
+    return await gateway.generate_content(prompt, purpose, request=request, model=model, **kwargs)
+
+
+def stream_content(prompt: str, purpose: str, model=None, **kwargs) -> AsyncIterator[str]:
+    return gateway.stream_content(prompt, purpose, model=model, **kwargs)
@@ -0,0 +1,83 @@
+"""Thread-safe LRU map whose entries expire, for the in-process caches.
+
+Each entry carries its own expiry on the map's clock (time.monotonic by
+default; caches keyed on wall-clock expiries such as a token's ``exp`` pass
+time.time). Expired entries are dropped when they are next looked up, and the
+least recently used entry is evicted once there are more than ``max_size``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+import metrics
+
+
+class ExpiringLRU:
+    def __init__(
+        self,
+        max_size: int,
+        clock: Callable[[], float] = time.monotonic,
+        size_gauge: Optional[metrics.Gauge] = None,
+        on_remove: Optional[Callable[[Hashable, object], None]] = None,
+    ):
+        self.max_size = max_size
+        self.clock = clock
+        self._size_gauge = size_gauge
+        # Called with (key, value) for every entry that leaves the map.
+        self._on_remove = on_remove
+        # key -> (expires_at, value); ordered oldest use first.
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _removed(self, key: Hashable, entry: tuple):
+        if self._on_remove is not None:
+            self._on_remove(key, entry[1])
+
+    def _update_size(self):
+        if self._size_gauge is not None:
+            self._size_gauge.set(len(self._entries))
+
+    def get(self, key: Hashable):
+        """The live value for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                self._removed(key, entry)
+                self._update_size()
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value, expires_at: float):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._removed(key, entry)
+            self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_size:
+                self._removed(*self._entries.popitem(last=False))
+            self._update_size()
+
+    def pop(self, key: Hashable):
+        """Remove ``key``; its value (expired or not), or None if it was not there."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._removed(key, entry)
+            self._update_size()
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._update_size()
@@ -1,183 +1,221 @@
+import asyncio
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import os
-import random
+import json
+import math
 import re
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, status
-from typing import Optional
+import secrets
+import time
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Header, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from bson import ObjectId
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import pypdf
-import docx
-import google.generativeai as genai
 
 import resend
 
-from cryptography.fernet import Fernet
-
 import assemblyai as aai
 
 
 
-import crud
-
-
-
-from database import User, Upload, Feedback, AnalysisFeedback
-
-
-
-from auth import (
-
-
-
-    create_access_token,
+import async_crud
 
+import llm
 
+import prompts
 
-    get_current_user,
+from analysis_cache import analysis_cache, analysis_cache_key
 
+import context_cache
 
+from context_summary import generate_context_summary, get_context_summary, summaries_enabled, summary_pending
 
-    get_password_hash,
 
+from background import context_summary_queue, question_queue
 
+from encryption import encrypt_file, decrypt_file, iter_decrypted
 
-    verify_password,
+from blobstore import get_blob_store
 
+from ingest import SpooledUpload, check_content_length, spool_upload
 
+import extraction
 
-    ACCESS_TOKEN_EXPIRE_MINUTES,
+from extraction import extract_text_from_bytes, guess_content_type, text_sha256
 
+import metrics
 
+from resources import InFlightMiddleware, resources
 
-    Token,
 
 
+from database import User, Upload, Blob, Session, Feedback, AnalysisFeedback
 
-)
 
 
+from auth import (
 
-from datetime import timedelta
 
 
+    create_access_token,
 
-from fastapi.security import OAuth2PasswordRequestForm
 
 
+    get_current_user,
 
 
 
+    hash_password,
 
 
 
+    verify_and_update_password,
 
 
 
-app = FastAPI()
+    create_refresh_token,
+    hash_refresh_token,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS,
 
 
 
+    Token,
 
 
 
+)
 
-# Configure CORS
 
 
+from datetime import datetime, timedelta
 
-origins = ["*"]
+from contextlib import aclosing, asynccontextmanager
 
 
 
+from fastapi.security import OAuth2PasswordRequestForm
 
 
 
 
-app.add_middleware(
 
 
 
-    CORSMiddleware,
 
 
 
-    allow_origins=origins,
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connections, API clients and worker pools are created per process here,
+    # after any pre-fork, instead of at import time.
+    await resources.startup()
+    try:
+        yield
+    finally:
+        await resources.shutdown()
 
 
-    allow_credentials=True,
+app = FastAPI(lifespan=lifespan)
 
 
 
-    allow_methods=["*"],
 
 
 
-    allow_headers=["*"],
 
+# Configure CORS
 
 
-)
 
+origins = ["*"]
 
 
 
 
 
 
-# Generate a key for encryption.
 
+app.add_middleware(
 
 
-# In a production environment, this key should be stored securely, for example, in an environment variable.
 
+    CORSMiddleware,
 
 
-# You can generate a key using: from cryptography.fernet import Fernet; Fernet.generate_key()
 
+    allow_origins=origins,
 
 
-ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY", "your-32-byte-long-url-safe-base64-encoded-encryption-key").encode()
 
+    allow_credentials=True,
 
 
-cipher_suite = Fernet(ENCRYPTION_KEY)
 
+    allow_methods=["*"],
 
 
 
+    allow_headers=["*"],
 
 
 
-def encrypt_file(data: bytes) -> bytes:
+)
 
 
 
-    return cipher_suite.encrypt(data)
 
 
 
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized uploads, and uploads that do not declare their size,
+    # from the Content-Length header before the multipart body is read.
+    if request.method == "POST" and request.url.path == "/api/upload":
+        try:
+            check_content_length(request.headers.get("content-length", ""))
+        except HTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+    return await call_next(request)
 
 
 
-def decrypt_file(data: bytes) -> bytes:
 
 
 
-    return cipher_suite.decrypt(data)
 
 
 
+# Outermost, so a request counts as in flight until its response is fully sent.
+app.add_middleware(InFlightMiddleware, resources=resources)
 
 
+# Scrapers send "Authorization: Bearer $METRICS_TOKEN". Without a token
+# configured the endpoint is disabled rather than public.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+def get_metrics():
+    return metrics.snapshot()
 
 
 @app.get("/")
@@ -216,7 +254,7 @@ async def root():
 
 
 
-def register(form_data: OAuth2PasswordRequestForm = Depends()):
+async def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
@@ -224,7 +262,7 @@ def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
-        db_user = crud.get_user_by_username(form_data.username)
+        db_user = await async_crud.get_user_by_username(form_data.username)
 
 
 
@@ -248,7 +286,7 @@ def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
-        db_user_email = crud.get_user_by_email(form_data.username)
+        db_user_email = await async_crud.get_user_by_email(form_data.username)
 
 
 
@@ -272,7 +310,7 @@ def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
-        hashed_password = get_password_hash(form_data.password)
+        hashed_password = await hash_password(form_data.password)
 
 
 
@@ -280,7 +318,7 @@ def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
-        user_id = crud.create_user(user)
+        user_id = await async_crud.create_user(user)
 
 
 
@@ -288,6 +326,8 @@ def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
+    except HTTPException:
+        raise
     except Exception as e:
 
 
@@ -304,19 +344,40 @@ def register(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
+async def issue_tokens(user_id: str, username: str, family_id: Optional[str] = None) -> dict:
+    """Create an access token plus a refresh token, recording the refresh token's session."""
+    access_token = create_access_token(
+        data={"sub": username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token, token_hash = create_refresh_token()
+    now = datetime.utcnow()
+    await async_crud.create_session(Session(
+        user_id=user_id,
+        username=username,
+        family_id=family_id or str(ObjectId()),
+        token_hash=token_hash,
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
 @app.post("/login", response_model=Token)
 
 
 
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
-    user = crud.get_user_by_username(form_data.username)
+    user = await async_crud.get_user_by_username(form_data.username)
 
 
 
-    if not user or not verify_password(form_data.password, user["password"]):
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await verify_and_update_password(form_data.password, user["password"])
+    if not verified:
 
 
 
@@ -340,39 +401,67 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-
+    if new_hash is not None:
+        # Stored with an older bcrypt cost or scheme; upgrade while we have the password.
+        await async_crud.update_user_password(user["_id"], new_hash)
 
 
-    access_token = create_access_token(
 
+    return await issue_tokens(str(user["_id"]), user["username"])
 
 
-        data={"sub": user["username"]}, expires_delta=access_token_expires
 
 
 
-    )
 
 
 
-    return {"access_token": access_token, "token_type": "bearer"}
 
 
 
+class RefreshTokenPayload(BaseModel):
+    refresh_token: str
 
 
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(payload: RefreshTokenPayload):
+    # No password check and no user lookup: the session carries the username.
+    token_hash = hash_refresh_token(payload.refresh_token)
+    session = await async_crud.rotate_session(token_hash, datetime.utcnow())
+    if session is None:
+        previous = await async_crud.get_session_by_token_hash(token_hash)
+        if previous is not None and previous.get("rotated_at") is not None:
+            # A refresh token was used twice, so it has leaked: end every
+            # session descended from the same login.
+            print(f"WARNING: refresh token reuse for user {previous['user_id']}; revoking its session family.")
+            await async_crud.revoke_session_family(previous["family_id"])
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await issue_tokens(session["user_id"], session["username"], family_id=session["family_id"])
 
 
+@app.post("/token/revoke")
+async def revoke_refresh_token(payload: RefreshTokenPayload):
+    session = await async_crud.get_session_by_token_hash(hash_refresh_token(payload.refresh_token))
+    if session is not None:
+        await async_crud.revoke_session_family(session["family_id"])
+    return {"message": "Refresh token revoked."}
 
 
+@app.post("/token/revoke-all")
+async def revoke_all_refresh_tokens(current_user: User = Depends(get_current_user)):
+    await async_crud.revoke_user_sessions(str(current_user["_id"]))
+    return {"message": "All sessions revoked."}
 
 
 @app.get("/users/me", response_model=User)
 
 
 
-def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: User = Depends(get_current_user)):
 
 
 
@@ -384,111 +473,238 @@ def read_users_me(current_user: User = Depends(get_current_user)):
 
 
 
-# Helper: Extract text from PDF
-
-
-
-def extract_text_from_pdf(file):
-
-
-
-    try:
+def _read_decrypted(blob_file) -> bytes:
+    with blob_file:
+        return b"".join(iter_decrypted(blob_file))
 
 
+# Helper: Load the extracted resume / job description text for an upload
+async def load_upload_text(upload: dict, field: str) -> str:
+    encrypted_text = upload.get(f"{field}_text")
+    if encrypted_text is not None:
+        return decrypt_file(encrypted_text).decode("utf-8")
+    # Uploads stored before text was persisted at upload time: fall back to
+    # extracting from the original file once and backfilling the derived text.
+    data = await async_crud.get_inline_upload_file(str(upload["_id"]), field)
+    if data is None:
+        blob_file = await async_crud.open_blob(upload[f"{field}_sha256"])
+        data = await run_in_threadpool(_read_decrypted, blob_file)
+    else:
+        data = await run_in_threadpool(decrypt_file, data)
+    text = (await run_in_threadpool(
+        extract_text_from_bytes,
+        data,
+        guess_content_type(upload.get(f"filename_{field}")),
+    )).text
+    await async_crud.update_upload_text(str(upload["_id"]), field, encrypt_file(text.encode("utf-8")), text_sha256(text))
+    return text
 
-        pdf_reader = pypdf.PdfReader(file)
 
+# ===============================
 
 
-        text = ""
 
+# 📂 Upload Job Description & Resume
 
 
-        for page in pdf_reader.pages:
 
+# ===============================
 
 
-            text += page.extract_text()
 
+# Helper: Store an uploaded file as a content-addressed blob
+async def store_blob(spooled: SpooledUpload, content_type: str) -> dict:
+    """Reference the blob for this file's content, creating it if it is new.
+
+    Returns the blob metadata (without the file data). When the same file was
+    uploaded before, its stored copy is reused, and so is its extracted text
+    unless that was extracted as another content type this one can improve on.
+    """
+    blob = await async_crud.acquire_blob(spooled.sha256)
+    if blob is not None:
+        text_content_type = blob.get("text_content_type", blob.get("content_type"))
+        if content_type == text_content_type or not extraction.can_extract(content_type):
+            return blob
+        try:
+            extracted = await extraction.engine.extract(spooled.path, content_type)
+        except BaseException:
+            await async_crud.release_blob(spooled.sha256)
+            raise
+        text = encrypt_file(extracted.text.encode("utf-8"))
+        await async_crud.update_blob_text(
+            spooled.sha256, text, text_sha256(extracted.text), extracted.truncated, content_type
+        )
+        blob.update(
+            text=text,
+            text_sha256=text_sha256(extracted.text),
+            text_truncated=extracted.truncated,
+            text_content_type=content_type,
+        )
+        return blob
+    extracted = await extraction.engine.extract(spooled.path, content_type)
+    # Stream the encrypted spool file into the blob store chunk by chunk.
+    data_key = str(ObjectId())
+    await run_in_threadpool(get_blob_store().put, data_key, spooled.open_encrypted())
+    blob = Blob(
+        _id=spooled.sha256,
+        data_key=data_key,
+        size=spooled.size,
+        content_type=content_type,
+        text=encrypt_file(extracted.text.encode("utf-8")),
+        text_sha256=text_sha256(extracted.text),
+        text_truncated=extracted.truncated,
+        text_content_type=content_type,
+    )
+    await async_crud.create_blob(blob)
+    return blob.dict(by_alias=True, exclude={"data"})
 
 
-        return text
+@app.post("/api/upload")
+async def upload_files(
+    name: str = Form(...),
+    experience: str = Form(...),
+    yearsOfExperience: Optional[str] = Form(None),
+    jobDescription: UploadFile = File(...),
+    resume: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    spooled_job_description = None
+    spooled_resume = None
+    acquired = []
+    try:
+        # Hash and encrypt both files in bounded chunks before doing anything else,
+        # so an oversized file is rejected without being parsed.
+        spooled_job_description = await spool_upload(jobDescription)
+        spooled_resume = await spool_upload(resume)
+
+        # Store each file once per distinct content. Text is extracted only for
+        # content not seen before, so downstream endpoints never have to
+        # decrypt and re-parse the original files.
+        job_description_blob, resume_blob = await asyncio.gather(
+            store_blob(spooled_job_description, jobDescription.content_type),
+            store_blob(spooled_resume, resume.content_type),
+            return_exceptions=True,
+        )
+        for blob in (job_description_blob, resume_blob):
+            if not isinstance(blob, BaseException):
+                acquired.append(blob["_id"])
+        for blob in (job_description_blob, resume_blob):
+            if isinstance(blob, BaseException):
+                raise blob
 
+        upload = Upload(
+            user_id=str(current_user["_id"]),
+            resume_sha256=resume_blob["_id"],
+            job_description_sha256=job_description_blob["_id"],
+            resume_text=resume_blob["text"],
+            job_description_text=job_description_blob["text"],
+            resume_text_sha256=resume_blob["text_sha256"],
+            job_description_text_sha256=job_description_blob["text_sha256"],
+            resume_text_truncated=resume_blob["text_truncated"],
+            job_description_text_truncated=job_description_blob["text_truncated"],
+            filename_resume=resume.filename,
+            filename_job_description=jobDescription.filename,
+            experience=experience,
+            yearsOfExperience=yearsOfExperience,
+            questions_status="pending",
+        )
+        upload_id = await async_crud.create_upload(upload)
+        acquired = []
+        schedule_question_generation({
+            "_id": upload_id,
+            "resume_sha256": upload.resume_sha256,
+            "job_description_sha256": upload.job_description_sha256,
+            "resume_text_sha256": upload.resume_text_sha256,
+            "job_description_text_sha256": upload.job_description_text_sha256,
+            "experience": upload.experience,
+            "yearsOfExperience": upload.yearsOfExperience,
+        })
+        if summaries_enabled():
+            schedule_context_summary(upload_id)
 
+        return {
+            "message": "Files uploaded successfully!",
+            "upload_id": upload_id
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
-
-
-
-        raise HTTPException(status_code=500, detail=f"Failed to extract text from PDF: {str(e)}")
-
-
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Drop the blob references taken for an upload that was never saved.
+        for sha256 in acquired:
+            await async_crud.release_blob(sha256)
+        for spooled in (spooled_job_description, spooled_resume):
+            if spooled is not None:
+                spooled.close()
 
 
 
 
 
-# Helper: Extract text from DOCX
 
+# ===============================
 
 
-def extract_text_from_docx(file):
 
+# 📄 Get Job Description
 
 
-    try:
 
+# ===============================
 
 
-        doc = docx.Document(file)
 
+@app.get("/api/job-description")
 
 
-        text = ""
 
+async def get_job_description(current_user: User = Depends(get_current_user)):
 
 
-        for para in doc.paragraphs:
 
+    upload = await async_crud.get_latest_upload_text(str(current_user["_id"]), ("job_description",))
 
 
-            text += para.text + "\n"
 
+    if not upload:
 
 
-        return text
 
+        raise HTTPException(status_code=404, detail="No upload found for the user.")
 
 
-    except Exception as e:
 
+    
 
 
-        raise HTTPException(status_code=500, detail=f"Failed to extract text from DOCX: {str(e)}")
 
+    job_description_text = await load_upload_text(upload, "job_description")
 
 
 
 
 
 
-# Configure APIs
 
+    return {
 
 
 
+        "message": "Job description retrieved successfully.",
 
 
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        "jobDescription": job_description_text
 
 
 
+    }
 
 
 
 
-aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
 
 
 
@@ -500,7 +716,7 @@ aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
 
 
 
-# 📂 Upload Job Description & Resume
+# ❓ Get Generated Questions
 
 
 
@@ -508,223 +724,412 @@ aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
 
 
 
-@app.post("/api/upload")
+# Questions are generated in the background, starting right after upload.
+# Exactly one generation runs per upload: the queue holds at most one job per
+# upload in this worker, and workers coordinate through a lease on the upload
+# document.
+QUESTIONS_LEASE_SECONDS = llm.PURPOSES["questions"].timeout + 30
+QUESTIONS_RETRY_AFTER_SECONDS = 2
+# A failed generation is retried by the next poll after this long, doubling
+# with every further attempt up to QUESTIONS_MAX_RETRY_SECONDS.
+QUESTIONS_RETRY_SECONDS = float(os.environ.get("QUESTIONS_RETRY_SECONDS", 30))
+QUESTIONS_MAX_RETRY_SECONDS = float(os.environ.get("QUESTIONS_MAX_RETRY_SECONDS", 3600))
 
 
+def questions_retry_at(upload: dict) -> Optional[datetime]:
+    """When a failed generation may be retried, or None if nothing holds it back."""
+    failed_at = upload.get("questions_failed_at")
+    if upload.get("questions_status") != "failed" or failed_at is None:
+        return None
+    backoff = QUESTIONS_RETRY_SECONDS * 2 ** max(upload.get("questions_attempts", 1) - 1, 0)
+    return failed_at + timedelta(seconds=min(backoff, QUESTIONS_MAX_RETRY_SECONDS))
 
-async def upload_files(
 
+def schedule_question_generation(upload: dict) -> bool:
+    return question_queue.submit(str(upload["_id"]), lambda: prepare_upload_questions(upload))
 
 
-    name: str = Form(...),
+async def reuse_upload_questions(upload: dict) -> Optional[list]:
+    """Copy the questions generated for an earlier upload of the same files, if any."""
+    if not (upload.get("resume_sha256") and upload.get("job_description_sha256")):
+        return None
+    reused_questions = await async_crud.find_generated_questions(
+        upload["resume_sha256"],
+        upload["job_description_sha256"],
+        upload.get("resume_text_sha256"),
+        upload.get("job_description_text_sha256"),
+        upload["experience"],
+        upload.get("yearsOfExperience"),
+    )
+    if reused_questions:
+        await async_crud.update_upload_questions(str(upload["_id"]), reused_questions)
+    return reused_questions
 
 
+async def prepare_upload_questions(upload: dict):
+    if not await reuse_upload_questions(upload):
+        await generate_upload_questions(upload)
 
-    experience: str = Form(...),
 
+async def generate_upload_questions(upload: dict):
+    upload_id = str(upload["_id"])
+    owner = f"{os.getpid()}-{ObjectId()}"
+    if not await async_crud.acquire_questions_lease(upload_id, owner, datetime.utcnow(), QUESTIONS_LEASE_SECONDS):
+        return  # Already generated, or another worker is on it.
+    # Each question is stored as soon as it is parsed, for /api/questions/stream.
+    async with aclosing(stream_new_questions(upload, owner)) as questions:
+        async for question in questions:
+            await async_crud.append_upload_question(upload_id, owner, question)
 
 
-    yearsOfExperience: Optional[str] = Form(None),
+async def build_questions_prompt(upload: dict) -> str:
+    # Cache miss: only now fetch the (much larger) extracted text.
+    upload = {**upload, **(await async_crud.get_upload_text(str(upload["_id"])))}
+    resume_text = prompts.fit("resume", await load_upload_text(upload, "resume"))
+    job_description_text = prompts.fit("job_description", await load_upload_text(upload, "job_description"))
 
 
 
-    jobDescription: UploadFile = File(...),
 
 
 
-    resume: UploadFile = File(...),
 
+    experience_text = (
 
 
-    current_user: User = Depends(get_current_user)
 
+        f"The candidate is experienced with {prompts.fit('years_of_experience', upload['yearsOfExperience'] or '')} years of experience."
 
 
-):
 
+        if upload['experience'].lower() == "experienced"
 
 
-    try:
 
+        else "The candidate is a fresher."
 
 
-        # Process Job Description
 
+    )
 
 
-        job_description_content = await jobDescription.read()
 
 
 
-        if jobDescription.content_type == "text/plain":
 
 
+    prompt = f"""
 
-            job_description_text = job_description_content.decode("utf-8")
 
 
+You are an expert technical interviewer. Your task is to generate a list of 20 interview questions
 
-        elif jobDescription.content_type == "application/pdf":
 
 
+based on the provided job description, candidate resume, and experience.
 
-            job_description_text = extract_text_from_pdf(jobDescription.file)
 
 
 
-        elif jobDescription.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
 
 
 
-            job_description_text = extract_text_from_docx(jobDescription.file)
+Instructions:
 
 
 
-        else:
+1. Analyze the Job Description and Resume carefully.
 
 
 
-            job_description_text = ""
+2. Consider that {experience_text}
 
 
 
+3. Tailor the difficulty and type of questions accordingly.
 
 
 
+4. Generate realistic, high-quality questions without placeholders.
 
-        # Process Resume
 
 
 
-        resume_content = await resume.read()
 
 
 
-        if resume.content_type == "text/plain":
+Job Description:
 
 
 
-            resume_text = resume_content.decode("utf-8")
+{job_description_text}
 
 
 
-        elif resume.content_type == "application/pdf":
 
 
 
-            resume_text = extract_text_from_pdf(resume.file)
 
+Resume:
 
 
-        elif resume.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
 
+{resume_text}
 
 
-            resume_text = extract_text_from_docx(resume.file)
 
+"""
 
 
-        else:
 
 
 
-            resume_text = ""
 
 
+    return prompt
 
 
+@app.get("/api/questions")
+async def get_questions(current_user: User = Depends(get_current_user)):
+    upload = await async_crud.get_latest_upload_questions(str(current_user["_id"]))
+    if not upload:
+        raise HTTPException(status_code=404, detail="No upload found for the user.")
+    if upload.get("generated_questions"):
+        return {
+            "message": "Questions retrieved successfully.",
+            "questions": upload["generated_questions"],
+            "count": len(upload["generated_questions"])
+        }
+    now = datetime.utcnow()
+    lease = upload.get("questions_lease")
+    retry_at = questions_retry_at(upload)
+    retry_after = QUESTIONS_RETRY_AFTER_SECONDS
+    if lease and lease["expires_at"] > now:
+        status_text = "generating"
+    elif retry_at is not None and retry_at > now:
+        # Failed recently: back off instead of calling the model on every poll.
+        status_text = "failed"
+        retry_after = max(retry_after, math.ceil((retry_at - now).total_seconds()))
+    else:
+        # Queued here but not started yet, lost with a worker that exited,
+        # failed, or uploaded before background generation: (re)schedule it.
+        # Re-submitting an upload that is already queued is a no-op.
+        schedule_question_generation(upload)
+        status_text = "pending"
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "message": "Questions are being generated.",
+            "status": status_text,
+            "progress": len(upload.get("streamed_questions") or []),
+            "last_error": upload.get("questions_error") if upload.get("questions_status") == "failed" else None,
+        },
+        headers={"Retry-After": str(retry_after)},
+    )
 
 
 
-        # Encrypt and save files
 
+# ===============================
+# ❓ Stream Generated Questions (SSE)
+# ===============================
+QUESTION_LINE = re.compile(r"^\s*\d+\.\s*(.*)")
+QUESTIONS_STREAM_POLL_SECONDS = 0.5
 
 
-        encrypted_resume = encrypt_file(resume_content)
+class QuestionStreamParser:
+    """Pull numbered questions out of streamed text, one complete line at a time."""
 
+    def __init__(self, limit: int = 20):
+        self.limit = limit
+        self.questions = []
+        self._buffer = ""
 
+    def _parse_lines(self, lines) -> list:
+        new_questions = []
+        for line in lines:
+            match = QUESTION_LINE.match(line)
+            question = match.group(1).strip() if match else ""
+            if question and question not in self.questions and len(self.questions) < self.limit:
+                self.questions.append(question)
+                new_questions.append(question)
+        return new_questions
 
-        encrypted_job_description = encrypt_file(job_description_content)
+    def feed(self, text: str) -> list:
+        """Add streamed text; return the questions completed by it."""
+        lines = (self._buffer + text).split("\n")
+        self._buffer = lines.pop()
+        return self._parse_lines(lines)
 
+    def finish(self) -> list:
+        lines, self._buffer = [self._buffer], ""
+        return self._parse_lines(lines)
 
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
+async def stream_new_questions(upload: dict, owner: str):
+    """Generate an upload's questions (its lease is held by ``owner``), yielding each as it is parsed."""
+    upload_id = str(upload["_id"])
+    parser = QuestionStreamParser()
+    try:
+        prompt = await build_questions_prompt(upload)
+        async for text in llm.stream_content(prompt, "questions"):
+            for question in parser.feed(text):
+                yield question
+        for question in parser.finish():
+            yield question
+        if not parser.questions:
+            raise ValueError("The AI service returned no questions.")
+    except BaseException as e:
+        # Shutdown cancelling the job is not the job's fault: the next poll
+        # reschedules it without backing off.
+        failed_at = datetime.utcnow() if isinstance(e, Exception) else None
+        await async_crud.mark_upload_questions_failed(upload_id, owner, str(e) or type(e).__name__, failed_at)
+        raise
+    # Kept in the order they were streamed.
+    await async_crud.update_upload_questions(upload_id, parser.questions)
+
+
+async def question_events(upload: dict):
+    """Follow the upload's background generation, sending each question once it is stored."""
+    upload_id = str(upload["_id"])
+    # Failures of generations that started before this stream are retried, not reported.
+    attempts = upload.get("questions_attempts", 0)
+    sent = []
+    state = upload
+    # One generation holds its lease at most this long; stop following after that.
+    deadline = time.monotonic() + QUESTIONS_LEASE_SECONDS
+    try:
+        while not state.get("generated_questions"):
+            if time.monotonic() > deadline:
+                raise HTTPException(status_code=504, detail="Timed out waiting for the questions.")
+            lease = state.get("questions_lease")
+            retry_at = questions_retry_at(state)
+            if state.get("questions_status") == "failed" and (
+                sent or state.get("questions_attempts", 0) > attempts or (retry_at is not None and retry_at > datetime.utcnow())
+            ):
+                raise HTTPException(status_code=502, detail=state.get("questions_error") or "Question generation failed.")
+            if lease and lease["expires_at"] > datetime.utcnow():
+                streamed = state.get("streamed_questions") or []
+                if streamed[:len(sent)] != sent:
+                    raise HTTPException(status_code=502, detail="Question generation was restarted.")
+                for question in streamed[len(sent):]:
+                    yield sse_event("question", {"index": len(sent), "question": question})
+                    sent.append(question)
+            else:
+                # Queued but not started yet, lost with a worker that exited, or
+                # failed before this stream: (re)schedule it.
+                if not schedule_question_generation(upload):
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Question generation is busy, please retry shortly.",
+                    )
+            # Comment lines keep proxies from timing out the idle stream.
+            yield ": waiting\n\n"
+            await asyncio.sleep(QUESTIONS_STREAM_POLL_SECONDS)
+            state = await async_crud.get_upload_questions_state(upload_id)
+            if state is None:
+                raise HTTPException(status_code=404, detail="No upload found for the user.")
+        questions = state["generated_questions"]
+        if questions[:len(sent)] != sent:
+            raise HTTPException(status_code=502, detail="Question generation was restarted.")
+    except HTTPException as e:
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        return
+    except Exception as e:
+        yield sse_event("error", {"status": 500, "detail": f"Failed to generate questions: {str(e)}"})
+        return
+    for index in range(len(sent), len(questions)):
+        yield sse_event("question", {"index": index, "question": questions[index]})
+    yield sse_event("done", {"count": len(questions)})
 
 
-        upload = Upload(
+@app.get("/api/questions/stream")
+async def stream_questions(current_user: User = Depends(get_current_user)):
+    upload = await async_crud.get_latest_upload_questions(str(current_user["_id"]))
+    if not upload:
+        raise HTTPException(status_code=404, detail="No upload found for the user.")
+    return StreamingResponse(
+        question_events(upload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 
-            user_id=str(current_user["_id"]),
 
+# ===============================
 
 
-            resume=encrypted_resume,
 
+# 🎙️ Transcribe Audio
 
 
-            job_description=encrypted_job_description,
 
+# ===============================
 
 
-            filename_resume=resume.filename,
 
+@app.post("/api/transcribe")
 
 
-            filename_job_description=jobDescription.filename,
 
+async def transcribe_audio(
 
 
-            experience=experience,
 
+    audio_file: UploadFile = File(...),
 
 
-            yearsOfExperience=yearsOfExperience,
 
+    current_user: User = Depends(get_current_user)
 
 
-        )
 
+):
 
 
-        upload_id = crud.create_upload(upload)
 
+    try:
 
 
 
+        transcriber = aai.Transcriber()
 
 
 
-        return {
+        transcript = await run_in_threadpool(transcriber.transcribe, audio_file.file)
 
 
 
-            "message": "Files uploaded successfully!",
 
 
 
-            "upload_id": upload_id
 
+        if transcript.status == aai.TranscriptStatus.error:
 
 
-        }
 
+            raise HTTPException(status_code=500, detail=transcript.error)
 
 
 
 
 
 
-    except Exception as e:
 
+        return {"transcript": transcript.text}
 
 
-        raise HTTPException(status_code=500, detail=str(e))
 
+    except Exception as e:
 
 
 
+        raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {str(e)}")
 
 
 
@@ -736,7 +1141,7 @@ async def upload_files(
 
 
 
-# 📄 Get Job Description
+# 💬 Analyze Candidate Answer (Gemini)
 
 
 
@@ -744,723 +1149,344 @@ async def upload_files(
 
 
 
-@app.get("/api/job-description")
-
+class AnalyzeAnswerPayload(BaseModel):
 
 
-def get_job_description(current_user: User = Depends(get_current_user)):
 
+    question: str
 
 
-    upload = crud.get_latest_upload_by_user_id(str(current_user["_id"]))
 
+    answer: str
 
 
-    if not upload:
 
 
 
-        raise HTTPException(status_code=404, detail="No upload found for the user.")
 
 
+# Bump whenever the analysis prompt below changes, so cached analyses are not reused for it.
+ANALYSIS_PROMPT_VERSION = 3
+analysis_context_tokens_saved = metrics.counter(
+    "analysis_context_tokens_saved_total", "Estimated prompt tokens saved by context summaries and section budgets"
+)
 
-    
 
+def schedule_context_summary(upload_id: str) -> bool:
+    return context_summary_queue.submit(upload_id, lambda: prepare_context_summary(upload_id))
 
 
-    decrypted_job_description = decrypt_file(upload["job_description"])
+async def prepare_context_summary(upload_id: str):
+    upload = await async_crud.get_upload_text(upload_id)
+    if upload is None:
+        return
+    resume_text = await load_upload_text(upload, "resume")
+    job_description_text = await load_upload_text(upload, "job_description")
+    await generate_context_summary(upload, resume_text, job_description_text)
 
 
+def build_analysis_context(resume_text: str, job_description_text: str) -> str:
+    """The part of the analysis prompt shared by every answer of an upload; cacheable (see context_cache.py).
 
-    
+    Callers fit both texts to their prompt budgets first (see prompts.py).
+    """
+    return f"""
+You are an expert technical interviewer and career coach.
+Evaluate candidate answers to interview questions based on the job description and resume below.
 
+---
 
+Job Description:
+{job_description_text}
 
-    job_description_text = decrypted_job_description.decode("utf-8", errors="ignore")
+Resume Summary:
+{resume_text}
 
+---
 
+For each answer, do the following:
+1. Score the candidate's answer out of 30 points:
+   - Relevance to question and job description (10 pts)
+   - Clarity and structure (10 pts)
+   - Communication style & confidence (10 pts)
+2. Give 3 bullet points of feedback:
+   - What was done well
+   - What was missing or unclear
+   - What could be improved
+3. Suggest 1 key improvement area.
+4. Final verdict: strong / average / weak.
+"""
 
 
+def build_analysis_question(question: str, answer: str) -> str:
+    question = prompts.fit("question", question)
+    answer = prompts.fit("answer", answer)
+    return f"""
+Interview Question:
+{question}
 
+Transcript of Candidate's Answer:
+{answer}
+"""
 
 
+async def load_analysis_context(current_user: User) -> dict:
+    """The latest upload's texts and their summary, which every analysis for the user is graded against."""
+    upload = await async_crud.get_latest_upload_text(str(current_user["_id"]))
+    if not upload:
+        raise HTTPException(status_code=404, detail="No upload found for the user.")
+    resume_text = await load_upload_text(upload, "resume")
+    job_description_text = await load_upload_text(upload, "job_description")
+    summary = get_context_summary(upload, resume_text, job_description_text)
+    if summary is None and summary_pending(upload, resume_text, job_description_text):
+        # Not ready yet (or lost with a worker that exited): this analysis
+        # uses the full texts, later ones the summary.
+        schedule_context_summary(str(upload["_id"]))
     return {
+        "resume_text": resume_text,
+        "job_description_text": job_description_text,
+        "resume_text_sha256": upload.get("resume_text_sha256") or text_sha256(resume_text),
+        "job_description_text_sha256": upload.get("job_description_text_sha256") or text_sha256(job_description_text),
+        "summary": summary,
+        "upload": upload,
+    }
 
 
+def check_analysis_payload(payload: AnalyzeAnswerPayload):
+    if not payload.question or not payload.answer:
+        raise HTTPException(status_code=400, detail="Question and answer are required.")
 
-        "message": "Job description retrieved successfully.",
 
+async def prepare_analysis(payload: AnalyzeAnswerPayload, context: dict) -> dict:
+    """Cache key and prompt for ``payload``; ``feedback`` is already set when the analysis is cached."""
+    # Identical question, answer and documents: reuse the earlier analysis.
+    cache_key = analysis_cache_key(
+        ANALYSIS_PROMPT_VERSION,
+        llm.PURPOSES["analysis"].model,
+        payload.question,
+        payload.answer,
+        context["resume_text_sha256"],
+        context["job_description_text_sha256"],
+    )
+    feedback_text = await analysis_cache.get(cache_key)
+    if feedback_text is not None:
+        return {"cache_key": cache_key, "feedback": feedback_text, "prompt": None, "model": None}
+    full_context_tokens = llm.estimate_tokens(context["resume_text"]) + llm.estimate_tokens(context["job_description_text"])
+    if context["summary"] is not None:
+        resume_text = context["summary"]["candidate_profile"]
+        job_description_text = context["summary"]["job_requirements"]
+    else:
+        resume_text = context["resume_text"]
+        job_description_text = context["job_description_text"]
+    resume_text = prompts.fit("resume", resume_text)
+    job_description_text = prompts.fit("job_description", job_description_text)
+    shared_context = build_analysis_context(resume_text, job_description_text)
+    question = build_analysis_question(payload.question, payload.answer)
+    # With a cached context only the question and answer are sent.
+    model = await context_cache.cached_model(context["upload"], "analysis", shared_context)
+    context_tokens = llm.estimate_tokens(resume_text) + llm.estimate_tokens(job_description_text)
+    analysis_context_tokens_saved.inc(full_context_tokens - context_tokens)
+    print(
+        f"INFO: analysis prompt ~{llm.estimate_tokens(shared_context + question)} tokens, context ~{context_tokens} tokens "
+        f"({'summary' if context['summary'] is not None else 'full texts'}; full texts ~{full_context_tokens})"
+        f"{'; context cached, sending ~%d tokens' % llm.estimate_tokens(question) if model is not None else ''}"
+    )
+    return {
+        "cache_key": cache_key,
+        "feedback": None,
+        "prompt": shared_context + question,
+        "model": model,
+        "cached_prompt": question,
+        "upload": context["upload"],
+    }
 
 
-        "jobDescription": job_description_text
+async def analysis_failed_with_cached_context(analysis: dict, error: Exception) -> bool:
+    """Drop the upload's cached context if ``error`` came from using it; True if the caller should retry without."""
+    if analysis["model"] is None or isinstance(error, HTTPException):
+        return False
+    print(f"WARNING: analysis with a cached context failed, retrying with the whole prompt: {error}")
+    await context_cache.forget(analysis["upload"])
+    analysis["model"] = None
+    return True
 
 
+def analysis_record(payload: AnalyzeAnswerPayload, current_user: User, feedback_text: str) -> AnalysisFeedback:
+    return AnalysisFeedback(
+        user_id=str(current_user["_id"]),
+        question=payload.question,
+        answer=payload.answer,
+        feedback=feedback_text,
+    )
 
-    }
 
+async def save_analysis(payload: AnalyzeAnswerPayload, current_user: User, feedback_text: str):
+    await async_crud.create_analysis_feedback(analysis_record(payload, current_user, feedback_text))
 
 
+def generate_analysis_response(analysis: dict, request: Optional[Request] = None):
+    if analysis["model"] is not None:
+        return llm.generate_content(analysis["cached_prompt"], "analysis", request=request, model=analysis["model"])
+    return llm.generate_content(analysis["prompt"], "analysis", request=request)
 
 
+async def generate_analysis(payload: AnalyzeAnswerPayload, context: dict, request: Optional[Request] = None) -> str:
+    """Feedback for ``payload``, from the cache or a Gemini call."""
+    analysis = await prepare_analysis(payload, context)
+    if analysis["feedback"] is not None:
+        return analysis["feedback"]
+    started = time.perf_counter()
+    try:
+        response = await generate_analysis_response(analysis, request)
+    except Exception as e:
+        if not await analysis_failed_with_cached_context(analysis, e):
+            raise
+        response = await generate_analysis_response(analysis, request)
+    feedback_text = response.text
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        print(
+            f"INFO: analysis used {usage.prompt_token_count} prompt tokens "
+            f"({getattr(usage, 'cached_content_token_count', 0)} cached), {usage.candidates_token_count} output tokens"
+        )
+    await analysis_cache.put(analysis["cache_key"], feedback_text, time.perf_counter() - started)
+    return feedback_text
 
 
+@app.post("/api/analyze-answer")
+async def analyze_answer(payload: AnalyzeAnswerPayload, request: Request, current_user: User = Depends(get_current_user)):
+    try:
+        check_analysis_payload(payload)
+        context = await load_analysis_context(current_user)
+        feedback_text = await generate_analysis(payload, context, request=request)
+        await save_analysis(payload, current_user, feedback_text)
+        return {"feedback": feedback_text}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to analyze answer: {str(e)}")
 
 
+async def analysis_events(analysis: dict, payload: AnalyzeAnswerPayload, current_user: User):
+    feedback_text = analysis["feedback"]
+    try:
+        if feedback_text is None:
+            parts = []
+            started = time.perf_counter()
+            if analysis["model"] is not None:
+                chunks = llm.stream_content(analysis["cached_prompt"], "analysis", model=analysis["model"])
+            else:
+                chunks = llm.stream_content(analysis["prompt"], "analysis")
+            try:
+                async for text in chunks:
+                    parts.append(text)
+                    yield sse_event("delta", {"text": text})
+            except Exception as e:
+                # Text already sent cannot be taken back, so only retry before any.
+                retry = await analysis_failed_with_cached_context(analysis, e)
+                if parts or not retry:
+                    raise
+                async for text in llm.stream_content(analysis["prompt"], "analysis"):
+                    parts.append(text)
+                    yield sse_event("delta", {"text": text})
+            feedback_text = "".join(parts)
+            if not feedback_text:
+                raise ValueError("The AI service returned no feedback.")
+            await analysis_cache.put(analysis["cache_key"], feedback_text, time.perf_counter() - started)
+        else:
+            yield sse_event("delta", {"text": feedback_text})
+        # Only a finished analysis is stored. A client that disconnects closes
+        # this generator at a yield above, which cancels the generation and
+        # skips this.
+        await save_analysis(payload, current_user, feedback_text)
+    except HTTPException as e:
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        return
+    except Exception as e:
+        yield sse_event("error", {"status": 500, "detail": f"Failed to analyze answer: {str(e)}"})
+        return
+    yield sse_event("done", {"feedback": feedback_text})
 
 
-# ===============================
+@app.post("/api/analyze-answer/stream")
+async def stream_analysis(payload: AnalyzeAnswerPayload, current_user: User = Depends(get_current_user)):
+    """Like /api/analyze-answer, but sends the feedback as Server-Sent Events while it is generated."""
+    try:
+        check_analysis_payload(payload)
+        context = await load_analysis_context(current_user)
+        analysis = await prepare_analysis(payload, context)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to analyze answer: {str(e)}")
+    return StreamingResponse(
+        analysis_events(analysis, payload, current_user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
+# ===============================
+# 💬 Analyze a Whole Interview
+# ===============================
+ANALYZE_BATCH_CONCURRENCY = int(os.environ.get("ANALYZE_BATCH_CONCURRENCY", 4))
+ANALYZE_BATCH_MAX_ANSWERS = int(os.environ.get("ANALYZE_BATCH_MAX_ANSWERS", 50))
 
-# ❓ Get Generated Questions
 
+class AnalyzeAnswersPayload(BaseModel):
+    answers: List[AnalyzeAnswerPayload]
 
 
-# ===============================
-
-
-
-@app.get("/api/questions")
-
-
-
-def get_questions(current_user: User = Depends(get_current_user)):
-
-
-
-    upload = crud.get_latest_upload_by_user_id(str(current_user["_id"]))
-
-
-
-    if not upload:
-
-
-
-        raise HTTPException(status_code=404, detail="No upload found for the user.")
-
-
-
-
-
-
-
-    if upload.get("generated_questions"):
-
-
-
-        return {
-
-
-
-            "message": "Questions retrieved successfully.",
-
-
-
-            "questions": upload["generated_questions"],
-
-
-
-            "count": len(upload["generated_questions"])
-
-
-
-        }
-
-
-
-
-
-
-
-    decrypted_resume = decrypt_file(upload["resume"])
-
-
-
-    decrypted_job_description = decrypt_file(upload["job_description"])
-
-
-
-
-
-
-
-    resume_text = decrypted_resume.decode("utf-8", errors="ignore")
-
-
-
-    job_description_text = decrypted_job_description.decode("utf-8", errors="ignore")
-
-
-
-
-
-
-
-    experience_text = (
-
-
-
-        f"The candidate is experienced with {upload['yearsOfExperience']} years of experience."
-
-
-
-        if upload['experience'].lower() == "experienced"
-
-
-
-        else "The candidate is a fresher."
-
-
-
-    )
-
-
-
-
-
-
-
-    prompt = f"""
-
-
-
-You are an expert technical interviewer. Your task is to generate a list of 20 interview questions
-
-
-
-based on the provided job description, candidate resume, and experience.
-
-
-
-
-
-
-
-Instructions:
-
-
-
-1. Analyze the Job Description and Resume carefully.
-
-
-
-2. Consider that {experience_text}
-
-
-
-3. Tailor the difficulty and type of questions accordingly.
-
-
-
-4. Generate realistic, high-quality questions without placeholders.
-
-
-
-
-
-
-
-Job Description:
-
-
-
-{job_description_text}
-
-
-
-
-
-
-
-Resume:
-
-
-
-{resume_text}
-
-
-
-"""
-
-
-
-
-
-
-
-    model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-pro-latest"))
-
-
-
-    response = model.generate_content(prompt)
-
-
-
-    analysis_text = response.text
-
-
-
-    print("===== Analysis Text from Gemini =====")
-
-
-
-    print(analysis_text)
-
-
-
-    print("=====================================")
-
-
-
-
-
-
-
-    question_regex = re.compile(r"^\s*\d+\.\s*(.*)", re.MULTILINE)
-
-
-
-    questions = question_regex.findall(analysis_text)
-
-
-
-    print("===== Extracted Questions =====")
-
-
-
-    print(questions)
-
-
-
-    print("=============================")
-
-
-
-
-
-
-
-    generated_questions = list(set(questions))
-
-
-
-    random.shuffle(generated_questions)
-
-
-
-    generated_questions = generated_questions[:20]
-
-
-
-
-
-
-
-    crud.update_upload_questions(str(upload["_id"]), generated_questions)
-
-
-
-
-
-
-
-    return {
-
-
-
-        "message": "Questions generated and retrieved successfully.",
-
-
-
-        "questions": generated_questions,
-
-
-
-        "count": len(generated_questions)
-
-
-
-    }
-
-
-
-
-
-
-
-# ===============================
-
-
-
-# 🎙️ Transcribe Audio
-
-
-
-# ===============================
-
-
-
-@app.post("/api/transcribe")
-
-
-
-async def transcribe_audio(
-
-
-
-    audio_file: UploadFile = File(...),
-
-
-
-    current_user: User = Depends(get_current_user)
-
-
-
-):
-
-
-
-    try:
-
-
-
-        transcriber = aai.Transcriber()
-
-
-
-        transcript = transcriber.transcribe(audio_file.file)
-
-
-
-
-
-
-
-        if transcript.status == aai.TranscriptStatus.error:
-
-
-
-            raise HTTPException(status_code=500, detail=transcript.error)
-
-
-
-
-
-
-
-        return {"transcript": transcript.text}
-
-
-
-    except Exception as e:
-
-
-
-        raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {str(e)}")
-
-
-
-
-
-
-
-# ===============================
-
-
-
-# 💬 Analyze Candidate Answer (Gemini)
-
-
-
-# ===============================
-
-
-
-class AnalyzeAnswerPayload(BaseModel):
-
-
-
-    question: str
-
-
-
-    answer: str
-
-
-
-
-
-
-
-@app.post("/api/analyze-answer")
-
-
-
-def analyze_answer(payload: AnalyzeAnswerPayload, current_user: User = Depends(get_current_user)):
-
-
-
-    upload = crud.get_latest_upload_by_user_id(str(current_user["_id"]))
-
-
-
-    if not upload:
-
-
-
-        raise HTTPException(status_code=404, detail="No upload found for the user.")
-
-
-
-
-
-
-
-    decrypted_resume = decrypt_file(upload["resume"])
-
-
-
-    decrypted_job_description = decrypt_file(upload["job_description"])
-
-
-
-
-
-
-
-    resume_text = decrypted_resume.decode("utf-8", errors="ignore")
-
-
-
-    job_description_text = decrypted_job_description.decode("utf-8", errors="ignore")
-
-
-
-    
-
+async def batch_analysis_events(payloads: List[AnalyzeAnswerPayload], context: dict, current_user: User):
+    limit = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
 
+    async def analyze(index: int, payload: AnalyzeAnswerPayload):
+        async with limit:
+            try:
+                return index, await generate_analysis(payload, context), None
+            except HTTPException as e:
+                return index, None, e
+            except Exception as e:
+                return index, None, HTTPException(status_code=500, detail=f"Failed to analyze answer: {str(e)}")
 
+    tasks = [asyncio.ensure_future(analyze(index, payload)) for index, payload in enumerate(payloads)]
+    records = {}
     try:
-
-
-
-        question = payload.question
-
-
-
-        answer = payload.answer
-
-
-
-
-
-
-
-        if not question or not answer:
-
-
-
-            raise HTTPException(status_code=400, detail="Question and answer are required.")
-
-
-
-
-
-
-
-        prompt = f"""
-
-
-
-You are an expert technical interviewer and career coach.
-
-
-
-Evaluate the following candidate answer based on the job description and resume.
-
-
-
-
-
-
-
----
-
-
-
-
-
-
-
-Job Description:
-
-
-
-{job_description_text}
-
-
-
-
-
-
-
-Resume Summary:
-
-
-
-{resume_text}
-
-
-
-
-
-
-
-Interview Question:
-
-
-
-{question}
-
-
-
-
-
-
-
-Transcript of Candidate's Answer:
-
-
-
-{answer}
-
-
-
----
-
-
-
-
-
-
-
-Do the following:
-
-
-
-1. Score the candidate's answer out of 30 points:
-
-
-
-   - Relevance to question and job description (10 pts)
-
-
-
-   - Clarity and structure (10 pts)
-
-
-
-   - Communication style & confidence (10 pts)
-
-
-
-2. Give 3 bullet points of feedback:
-
-
-
-   - What was done well
-
-
-
-   - What was missing or unclear
-
-
-
-   - What could be improved
-
-
-
-3. Suggest 1 key improvement area.
-
-
-
-4. Final verdict: strong / average / weak.
-
-
-
-"""
-
-
-
-
-
-
-
-        model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-pro-latest"))
-
-
-
-        response = model.generate_content(prompt)
-
-
-
-        feedback_text = response.text
-
-
-
-
-
-
-
-        # Store the analysis feedback
-
-
-
-        analysis_feedback = AnalysisFeedback(
-
-
-
-            user_id=str(current_user["_id"]),
-
-
-
-            question=question,
-
-
-
-            answer=answer,
-
-
-
-            feedback=feedback_text,
-
-
-
-        )
-
-
-
-        crud.create_analysis_feedback(analysis_feedback)
-
-
-
-
-
-
-
-        return {"feedback": feedback_text}
-
-
-
-
-
-
-
+        for next_done in asyncio.as_completed(tasks):
+            index, feedback_text, error = await next_done
+            if error is not None:
+                yield sse_event("error", {"index": index, "status": error.status_code, "detail": error.detail})
+                continue
+            records[index] = analysis_record(payloads[index], current_user, feedback_text)
+            yield sse_event("result", {"index": index, "question": payloads[index].question, "feedback": feedback_text})
+        # Stored once the whole interview is analyzed, in question order. A
+        # client that disconnects first cancels the rest and stores nothing;
+        # the analyses already made are cached for its retry.
+        await async_crud.create_analysis_feedbacks([records[index] for index in sorted(records)])
     except Exception as e:
-
-
-
-        raise HTTPException(status_code=500, detail=f"Failed to analyze answer: {str(e)}")
+        yield sse_event("error", {"status": 500, "detail": f"Failed to store feedback: {str(e)}"})
+        return
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield sse_event("done", {"count": len(records), "failed": len(payloads) - len(records)})
+
+
+@app.post("/api/analyze-answers")
+async def analyze_answers(payload: AnalyzeAnswersPayload, current_user: User = Depends(get_current_user)):
+    """Analyze every answer of an interview, sending each result as a Server-Sent Event as soon as it is ready."""
+    if not payload.answers:
+        raise HTTPException(status_code=400, detail="At least one answer is required.")
+    if len(payload.answers) > ANALYZE_BATCH_MAX_ANSWERS:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYZE_BATCH_MAX_ANSWERS} answers can be analyzed at once.")
+    for answer in payload.answers:
+        check_analysis_payload(answer)
+    context = await load_analysis_context(current_user)
+    return StreamingResponse(
+        batch_analysis_events(payload.answers, context, current_user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 
@@ -1496,7 +1522,7 @@ Do the following:
 
 
 
-def get_feedback(current_user: User = Depends(get_current_user)):
+async def get_feedback(current_user: User = Depends(get_current_user)):
 
 
 
@@ -1508,7 +1534,7 @@ def get_feedback(current_user: User = Depends(get_current_user)):
 
 
 
-    feedback = crud.get_analysis_feedback_by_user_id(str(current_user["_id"]))
+    feedback = await async_crud.get_analysis_feedback_by_user_id(str(current_user["_id"]))
 
 
 
@@ -1520,7 +1546,7 @@ def get_feedback(current_user: User = Depends(get_current_user)):
 
 
 
-    return feedback
+    return [{**item, "_id": str(item["_id"])} for item in feedback]
 
 
 
@@ -1588,7 +1614,7 @@ class SendFeedbackPayload(BaseModel):
 
 
 
-def send_feedback(payload: SendFeedbackPayload, current_user: User = Depends(get_current_user)):
+async def send_feedback(payload: SendFeedbackPayload, current_user: User = Depends(get_current_user)):
 
 
 
@@ -1612,7 +1638,7 @@ def send_feedback(payload: SendFeedbackPayload, current_user: User = Depends(get
 
 
 
-        feedback = crud.get_analysis_feedback_by_user_id(str(current_user["_id"]))
+        feedback = await async_crud.get_analysis_feedback_by_user_id(str(current_user["_id"]))
 
 
 
@@ -1688,7 +1714,7 @@ def send_feedback(payload: SendFeedbackPayload, current_user: User = Depends(get
 
 
 
-        resend.Emails.send(params)
+        await run_in_threadpool(resend.Emails.send, params)
 
 
 
@@ -1760,7 +1786,7 @@ class FeedbackPayload(BaseModel):
 
 
 
-def submit_feedback(payload: FeedbackPayload, current_user: User = Depends(get_current_user)):
+async def submit_feedback(payload: FeedbackPayload, current_user: User = Depends(get_current_user)):
 
 
 
@@ -1784,7 +1810,7 @@ def submit_feedback(payload: FeedbackPayload, current_user: User = Depends(get_c
 
 
 
-        crud.create_feedback(feedback)
+        await async_crud.create_feedback(feedback)
 
 
 
@@ -0,0 +1,115 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Sequence
+
+# Minimal in-process metrics. Each worker process keeps its own values; they are
+# exposed as JSON on GET /metrics (which requires METRICS_TOKEN, see main.py)
+# and are meant to be scraped per worker.
+
+_lock = threading.Lock()
+_registry: Dict[str, "Metric"] = {}
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Metric:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+
+    def snapshot(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    def __init__(self, name: str, description: str = ""):
+        super().__init__(name, description)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with _lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge(Metric):
+    def __init__(self, name: str, description: str = ""):
+        super().__init__(name, description)
+        self.value = 0
+
+    def set(self, value: float):
+        with _lock:
+            self.value = value
+
+    def inc(self, amount: float = 1):
+        with _lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with _lock:
+            self.value -= amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram(Metric):
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        with _lock:
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        with _lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets + (float("inf"),), self.bucket_counts):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "max": self.max,
+                "mean": self.sum / self.count if self.count else 0.0,
+                "buckets": buckets,
+            }
+
+
+def _get_or_create(cls, name: str, *args, **kwargs):
+    with _lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as a {type(metric).__name__}")
+        return metric
+
+
+def counter(name: str, description: str = "") -> Counter:
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name: str, description: str = "", buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, description, buckets)
+
+
+def snapshot() -> dict:
+    with _lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.snapshot() for metric in metrics}
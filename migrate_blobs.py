@@ -0,0 +1,135 @@
+"""Move file data stored inline in MongoDB documents into the blob store.
+
+Two kinds of documents still carry inline encrypted file bytes:
+
+* blobs with a ``data`` field, written before the blob store existed;
+* uploads with inline ``resume`` / ``job_description`` fields, written before
+  files were deduplicated into the blobs collection.
+
+Both are processed in batches and each document is updated with a conditional
+write, so the command can be interrupted and re-run safely.
+
+With --gc it then deletes unreferenced blobs (refcount <= 0) and their data.
+Releasing a blob deletes it straight away, so these are only left behind when a
+release was interrupted between its two writes.
+
+    python migrate_blobs.py [--batch-size 50] [--dry-run] [--gc]
+"""
+import argparse
+import hashlib
+
+from bson import ObjectId
+
+import crud
+from blobstore import get_blob_store
+from database import Blob, get_blob_collection, get_upload_collection
+from encryption import decrypt_file
+from extraction import guess_content_type
+
+
+def migrate_inline_blobs(batch_size: int, dry_run: bool) -> int:
+    blob_collection = get_blob_collection()
+    if dry_run:
+        return blob_collection.count_documents({"data": {"$ne": None}})
+    store = get_blob_store()
+    migrated = 0
+    while True:
+        batch = list(blob_collection.find({"data": {"$ne": None}}, projection={"data": 1}).limit(batch_size))
+        if not batch:
+            return migrated
+        for blob in batch:
+            data_key = str(ObjectId())
+            store.put_bytes(data_key, blob["data"])
+            result = blob_collection.update_one(
+                {"_id": blob["_id"], "data": {"$ne": None}},
+                {"$set": {"data_key": data_key}, "$unset": {"data": ""}},
+            )
+            if result.modified_count:
+                migrated += 1
+            else:
+                store.delete(data_key)
+        print(f"blobs: moved {migrated} so far")
+
+
+def _blob_for_inline_file(upload: dict, field: str, store) -> str:
+    """Reference (or create) the content-addressed blob for an upload's inline file."""
+    encrypted = upload[field]
+    plaintext = decrypt_file(encrypted)
+    sha256 = hashlib.sha256(plaintext).hexdigest()
+    if crud.acquire_blob(sha256) is not None:
+        return sha256
+    data_key = str(ObjectId())
+    store.put_bytes(data_key, encrypted)
+    crud.create_blob(Blob(
+        _id=sha256,
+        data_key=data_key,
+        size=len(plaintext),
+        content_type=guess_content_type(upload.get(f"filename_{field}")),
+        text=upload.get(f"{field}_text"),
+        text_sha256=upload.get(f"{field}_text_sha256"),
+        text_truncated=upload.get(f"{field}_text_truncated", False),
+    ))
+    return sha256
+
+
+def migrate_inline_uploads(batch_size: int, dry_run: bool) -> int:
+    upload_collection = get_upload_collection()
+    if dry_run:
+        return upload_collection.count_documents({"resume": {"$ne": None}})
+    store = get_blob_store()
+    migrated = 0
+    while True:
+        batch = list(upload_collection.find(
+            {"resume": {"$ne": None}},
+            projection={
+                "resume": 1, "job_description": 1,
+                "filename_resume": 1, "filename_job_description": 1,
+                "resume_text": 1, "job_description_text": 1,
+                "resume_text_sha256": 1, "job_description_text_sha256": 1,
+                "resume_text_truncated": 1, "job_description_text_truncated": 1,
+            },
+        ).limit(batch_size))
+        if not batch:
+            return migrated
+        for upload in batch:
+            resume_sha256 = _blob_for_inline_file(upload, "resume", store)
+            job_description_sha256 = _blob_for_inline_file(upload, "job_description", store)
+            result = upload_collection.update_one(
+                {"_id": upload["_id"], "resume": {"$ne": None}},
+                {
+                    "$set": {"resume_sha256": resume_sha256, "job_description_sha256": job_description_sha256},
+                    "$unset": {"resume": "", "job_description": ""},
+                },
+            )
+            if result.modified_count:
+                migrated += 1
+            else:
+                # Migrated concurrently by another run; drop our references.
+                crud.release_blob(resume_sha256)
+                crud.release_blob(job_description_sha256)
+        print(f"uploads: moved {migrated} so far")
+
+
+def collect_garbage(dry_run: bool) -> int:
+    if dry_run:
+        return get_blob_collection().count_documents({"refcount": {"$lte": 0}})
+    return crud.collect_garbage_blobs()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true", help="only count the documents that still need migrating")
+    parser.add_argument("--gc", action="store_true", help="also delete unreferenced blobs")
+    args = parser.parse_args()
+
+    blobs = migrate_inline_blobs(args.batch_size, args.dry_run)
+    uploads = migrate_inline_uploads(args.batch_size, args.dry_run)
+    print(f"Done: {blobs} blobs and {uploads} uploads {'to migrate' if args.dry_run else 'migrated'}.")
+    if args.gc:
+        garbage = collect_garbage(args.dry_run)
+        print(f"Unreferenced blobs {'to delete' if args.dry_run else 'deleted'}: {garbage}.")
+
+
+if __name__ == "__main__":
+    main()
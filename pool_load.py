@@ -0,0 +1,33 @@
+"""Load tracking for executors with a fixed number of workers.
+
+Counts the tasks submitted to a pool and not yet finished, and exports them as
+``<name>_tasks_in_flight`` plus ``<name>_queue_depth``: the tasks beyond the
+worker count, which are waiting for a free worker. Callers bound their queue by
+checking ``in_flight`` before submitting.
+"""
+from contextlib import contextmanager
+
+import metrics
+
+
+class PoolLoad:
+    def __init__(self, name: str, tasks: str, workers: int):
+        self.workers = workers
+        self.in_flight = 0
+        self._tasks_in_flight = metrics.gauge(f"{name}_tasks_in_flight", f"{tasks} submitted and not yet finished")
+        self._queue_depth = metrics.gauge(f"{name}_queue_depth", f"{tasks} waiting for a free worker")
+
+    def _update_gauges(self):
+        self._tasks_in_flight.set(self.in_flight)
+        self._queue_depth.set(max(0, self.in_flight - self.workers))
+
+    @contextmanager
+    def task(self):
+        """Count one task for the duration of the block."""
+        self.in_flight += 1
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._update_gauges()
@@ -0,0 +1,65 @@
+"""Token budgets for the user-supplied sections of every LLM prompt.
+
+Prompts embed text the API does not control: the job description, the resume,
+interview questions, transcribed answers and the years of experience typed into
+the upload form. Each section has a budget in estimated tokens (see
+llm.estimate_tokens), overridable with PROMPT_<SECTION>_MAX_TOKENS, and fit()
+cuts an overflowing section down to it at a line or word boundary, marking the
+cut so the model knows text is missing.
+
+Unless context caching is on, analysis prompts carry the condensed summary of
+the job description and resume (see context_summary.py), which is how long
+documents are summarized rather than cut; the summary prompt itself gets the larger
+*_source budgets. The budgets are the hard limit behind that.
+
+The estimated size of every prompt sent is recorded per purpose in the
+llm_<purpose>_prompt_tokens histogram (see llm.py).
+"""
+import os
+from typing import Dict
+
+import llm
+import metrics
+
+_DEFAULT_SECTION_TOKENS = {
+    "job_description": 4000,
+    "resume": 4000,
+    # Our own generated questions; a long one is a sign something is off.
+    "question": 500,
+    # A few minutes of transcribed speech is well under this.
+    "answer": 3000,
+    # A free-form form field that should hold a number.
+    "years_of_experience": 16,
+    # Input of the summary prompt: about what extraction keeps of a document.
+    "job_description_source": 15000,
+    "resume_source": 15000,
+}
+
+PROMPT_SECTION_TOKENS: Dict[str, int] = {
+    name: int(os.environ.get(f"PROMPT_{name.upper()}_MAX_TOKENS", default))
+    for name, default in _DEFAULT_SECTION_TOKENS.items()
+}
+
+TRUNCATION_MARK = "\n[... truncated ...]"
+
+_truncated: Dict[str, metrics.Counter] = {}
+
+
+def fit(section: str, text: str) -> str:
+    """``text`` cut down to the token budget of ``section``, if it is over."""
+    if section not in PROMPT_SECTION_TOKENS:
+        raise ValueError(f"Unknown prompt section {section!r}; expected one of {', '.join(PROMPT_SECTION_TOKENS)}.")
+    budget = PROMPT_SECTION_TOKENS[section]
+    tokens = llm.estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    max_chars = max(0, budget * llm.CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+    cut = text[:max_chars]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > max_chars // 2:
+        cut = cut[:boundary]
+    if section not in _truncated:
+        _truncated[section] = metrics.counter(f"prompt_{section}_truncated_total", f"Prompts whose {section} section was cut to its budget")
+    _truncated[section].inc()
+    print(f"WARNING: prompt section {section} cut from ~{tokens} to {budget} tokens")
+    return cut.rstrip() + TRUNCATION_MARK
@@ -0,0 +1,151 @@
+"""Per-worker resources, created and torn down by the FastAPI lifespan.
+
+Nothing here runs at import time. Under a pre-fork server every worker opens its
+own MongoDB connections and extraction pool after the fork, startup phases run
+concurrently and report their timings, and shutdown waits for in-flight
+requests to drain before closing anything.
+"""
+import asyncio
+import os
+import time
+
+import assemblyai as aai
+import google.generativeai as genai
+
+import blobstore
+from background import context_summary_queue, question_queue
+import context_cache
+import context_summary
+import database
+import extraction
+import hashing
+import llm
+import metrics
+from indexes import ensure_indexes
+from user_cache import USER_CACHE_CHANGE_STREAM, user_cache, watch_user_changes
+
+SHUTDOWN_DRAIN_TIMEOUT_SECONDS = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT_SECONDS", 30))
+ENSURE_INDEXES_ON_STARTUP = os.environ.get("ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"
+EXTRACTION_PREWARM = os.environ.get("EXTRACTION_PREWARM", "true").lower() == "true"
+
+
+class Resources:
+    def __init__(self):
+        self.phase_timings = {}
+        self.in_flight = 0
+        self._in_flight_gauge = metrics.gauge("http_requests_in_flight", "Requests currently being handled")
+        self._drained = None
+        self._background_tasks = []
+
+    # -- request tracking -------------------------------------------------
+
+    def request_started(self):
+        self.in_flight += 1
+        self._in_flight_gauge.set(self.in_flight)
+
+    def request_finished(self):
+        self.in_flight -= 1
+        self._in_flight_gauge.set(self.in_flight)
+        if self.in_flight == 0 and self._drained is not None:
+            self._drained.set()
+
+    # -- startup ----------------------------------------------------------
+
+    async def _timed(self, phase: str, coro):
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phase_timings[phase] = elapsed
+            metrics.gauge(f"startup_{phase}_seconds", f"Duration of the {phase} startup phase").set(elapsed)
+
+    async def _start_mongo(self):
+        await asyncio.to_thread(database.connect)
+        if ENSURE_INDEXES_ON_STARTUP:
+            await asyncio.to_thread(ensure_indexes)
+        if USER_CACHE_CHANGE_STREAM:
+            self._background_tasks.append(asyncio.create_task(watch_user_changes()))
+
+    async def _start_llm(self):
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        for purpose in llm.PURPOSES:
+            llm.gateway.registry.model(purpose)
+        # Fails startup on an unknown CONTEXT_CACHE_BACKEND.
+        context_cache.get_context_cache_backend()
+        if context_summary.CONTEXT_SUMMARY_ENABLED and not context_summary.summaries_enabled():
+            print(
+                f"WARNING: CONTEXT_CACHE_BACKEND={context_cache.CONTEXT_CACHE_BACKEND}, so context summaries are off; "
+                "analysis prompts cache the full texts instead."
+            )
+
+    async def _start_transcription(self):
+        aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
+
+    async def _start_extraction(self):
+        if EXTRACTION_PREWARM:
+            await extraction.engine.warm_up()
+
+    async def startup(self):
+        started = time.perf_counter()
+        question_queue.start()
+        context_summary_queue.start()
+        await asyncio.gather(
+            self._timed("mongo", self._start_mongo()),
+            self._timed("llm", self._start_llm()),
+            self._timed("transcription", self._start_transcription()),
+            self._timed("extraction", self._start_extraction()),
+        )
+        self.phase_timings["total"] = time.perf_counter() - started
+        timings = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phase_timings.items())
+        print(f"Startup complete (pid {os.getpid()}): {timings}")
+
+    # -- shutdown ---------------------------------------------------------
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT_SECONDS):
+        if self.in_flight == 0:
+            return
+        print(f"Waiting up to {timeout:.0f}s for {self.in_flight} in-flight requests to finish...")
+        self._drained = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"WARNING: shutting down with {self.in_flight} requests still in flight.")
+
+    async def shutdown(self):
+        await self.drain()
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks.clear()
+        # Cancels the running jobs too. An interrupted question generation is
+        # marked failed and an interrupted summary releases its lease, so the
+        # next poll or analysis of that upload reschedules it.
+        await question_queue.stop()
+        await context_summary_queue.stop()
+        user_cache.clear()
+        extraction.engine.shutdown()
+        hashing.pool.shutdown()
+        blobstore.close_blob_store()
+        await asyncio.to_thread(database.close)
+        print("Shutdown complete.")
+
+
+class InFlightMiddleware:
+    """ASGI middleware counting HTTP requests until their response body is fully sent."""
+
+    def __init__(self, app, resources: Resources):
+        self.app = app
+        self.resources = resources
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        self.resources.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.resources.request_finished()
+
+
+resources = Resources()
@@ -0,0 +1,38 @@
+"""Coalesce concurrent calls for the same key into one execution.
+
+The first caller for a key starts the work as its own task; callers that
+arrive while it runs await the same result instead of repeating it. Because
+the work is a separate task, a caller that gives up (client disconnect,
+cancellation) does not cancel it for the others.
+
+This only covers one process. Work that must run once across workers also
+needs a lease in MongoDB (see generate_upload_questions in main.py).
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+import metrics
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._executions = metrics.counter(f"singleflight_{name}_executions_total", f"{name} calls that did the work")
+        self._coalesced = metrics.counter(f"singleflight_{name}_coalesced_total", f"{name} calls that joined one already running")
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        self._calls.pop(key, None)
+        # Mark a failure as retrieved even if every caller has already left.
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            self._executions.inc()
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self._coalesced.inc()
+        return await asyncio.shield(task)
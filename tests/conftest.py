@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+from cryptography.fernet import Fernet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# encryption.py builds its cipher at import time.
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """database pointed at an in-memory MongoDB for the duration of a test."""
+    mongomock = pytest.importorskip("mongomock")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import database
+
+    client = mongomock.MongoClient()
+    async_client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "db", client["test"])
+    monkeypatch.setattr(database, "async_client", async_client)
+    monkeypatch.setattr(database, "async_db", async_client["test"])
+    return database
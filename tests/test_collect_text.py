@@ -0,0 +1,43 @@
+import io
+
+import pypdf
+
+from extraction import PDF_CONTENT_TYPE, _collect, collect_text
+
+
+def blank_pdf(pages: int) -> io.BytesIO:
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=72, height=72)
+    file = io.BytesIO()
+    writer.write(file)
+    file.seek(0)
+    return file
+
+
+def test_everything_within_budget():
+    assert collect_text(["ab", "cd", "ef"], max_chars=6) == ("abcdef", 3, False)
+    assert collect_text(["ab", "cd"]) == ("abcd", 2, False)
+    assert collect_text([]) == ("", 0, False)
+
+
+def test_char_budget_cuts_the_last_piece():
+    assert collect_text(["abc", "defg", "hij"], max_chars=5) == ("abcde", 2, True)
+
+
+def test_pieces_past_the_char_budget_are_not_read():
+    read = []
+
+    def pieces():
+        for piece in ("abc", "def", "ghi", "jkl"):
+            read.append(piece)
+            yield piece
+
+    assert collect_text(pieces(), max_chars=4).text == "abcd"
+    assert read == ["abc", "def"]
+
+
+def test_pdf_page_budget():
+    assert _collect(blank_pdf(5), PDF_CONTENT_TYPE, 3, None) == ("", 3, True)
+    assert _collect(blank_pdf(3), PDF_CONTENT_TYPE, 3, None) == ("", 3, False)
+    assert _collect(blank_pdf(2), PDF_CONTENT_TYPE, None, None) == ("", 2, False)
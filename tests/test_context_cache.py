@@ -0,0 +1,92 @@
+import pytest
+from bson import ObjectId
+
+import context_cache
+import llm
+
+pytestmark = pytest.mark.anyio
+
+# Comfortably above CONTEXT_CACHE_MIN_TOKENS.
+LONG_CONTEXT = "Job requirements and resume. " * (context_cache.CONTEXT_CACHE_MIN_TOKENS * llm.CHARS_PER_TOKEN // 20)
+
+
+class RecordingModel:
+    def __init__(self):
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return prompt
+
+
+@pytest.fixture
+def local_backend(monkeypatch, mongo):
+    monkeypatch.setattr(context_cache, "CONTEXT_CACHE_BACKEND", "local")
+    monkeypatch.setattr(context_cache, "_context_cache_backend", None)
+    model = RecordingModel()
+    monkeypatch.setattr(llm.gateway.registry, "model", lambda purpose: model)
+    return context_cache.get_context_cache_backend(), model
+
+
+async def new_upload(database) -> dict:
+    upload_id = ObjectId()
+    await database.get_async_upload_collection().insert_one({"_id": upload_id})
+    return {"_id": upload_id}
+
+
+async def test_short_context_is_not_cached(local_backend, mongo):
+    upload = await new_upload(mongo)
+    assert await context_cache.cached_model(upload, "analysis", "too short") is None
+    assert "context_cache" not in upload
+
+
+async def test_context_is_created_once_and_prepended(local_backend, mongo):
+    backend, model = local_backend
+    upload = await new_upload(mongo)
+
+    cached = await context_cache.cached_model(upload, "analysis", LONG_CONTEXT)
+    handle = upload["context_cache"]
+    assert handle["backend"] == "local"
+    stored = await mongo.get_async_upload_collection().find_one({"_id": upload["_id"]})
+    assert stored["context_cache"]["name"] == handle["name"]
+
+    await cached.generate_content_async("Question and answer")
+    assert model.prompts == [LONG_CONTEXT + "Question and answer"]
+
+    await context_cache.cached_model(upload, "analysis", LONG_CONTEXT)
+    assert upload["context_cache"]["name"] == handle["name"]
+    assert len(backend._contexts) == 1
+
+
+async def test_changed_context_replaces_the_old_one(local_backend, mongo):
+    backend, _ = local_backend
+    upload = await new_upload(mongo)
+    await context_cache.cached_model(upload, "analysis", LONG_CONTEXT)
+    old_name = upload["context_cache"]["name"]
+
+    await context_cache.cached_model(upload, "analysis", LONG_CONTEXT + "A new resume.")
+    assert upload["context_cache"]["name"] != old_name
+    assert old_name not in backend._contexts
+
+
+async def test_context_unknown_to_the_backend_is_recreated(local_backend, mongo):
+    backend, _ = local_backend
+    upload = await new_upload(mongo)
+    await context_cache.cached_model(upload, "analysis", LONG_CONTEXT)
+    old_name = upload["context_cache"]["name"]
+    # For example created by another worker, whose local contexts this one cannot see.
+    backend._contexts.clear()
+
+    assert await context_cache.cached_model(upload, "analysis", LONG_CONTEXT) is not None
+    assert upload["context_cache"]["name"] != old_name
+
+
+async def test_forget_drops_the_handle_and_backs_off(local_backend, mongo):
+    upload = await new_upload(mongo)
+    await context_cache.cached_model(upload, "analysis", LONG_CONTEXT)
+
+    await context_cache.forget(upload)
+    assert "context_cache" not in upload
+    stored = await mongo.get_async_upload_collection().find_one({"_id": upload["_id"]})
+    assert stored["context_cache"] is None
+    assert await context_cache.cached_model(upload, "analysis", LONG_CONTEXT) is None
@@ -0,0 +1,41 @@
+import io
+
+import pytest
+from cryptography.fernet import InvalidToken
+
+from encryption import FRAMED_MAGIC, decrypt_file, encrypt_file, encrypt_frame, iter_decrypted
+
+CHUNKS = [b"first chunk ", b"", b"x" * 100000, b"last"]
+
+
+def framed(chunks) -> bytes:
+    return FRAMED_MAGIC + b"".join(encrypt_frame(chunk) for chunk in chunks)
+
+
+def test_framed_round_trip():
+    data = framed(CHUNKS)
+    assert decrypt_file(data) == b"".join(CHUNKS)
+    assert b"".join(iter_decrypted(io.BytesIO(data))) == b"".join(CHUNKS)
+
+
+def test_iter_decrypted_yields_one_chunk_per_frame():
+    assert list(iter_decrypted(io.BytesIO(framed(CHUNKS)))) == CHUNKS
+
+
+def test_empty_framed_blob():
+    assert decrypt_file(FRAMED_MAGIC) == b""
+    assert list(iter_decrypted(io.BytesIO(FRAMED_MAGIC))) == []
+
+
+def test_legacy_single_token_blob():
+    data = encrypt_file(b"legacy contents")
+    assert not data.startswith(FRAMED_MAGIC)
+    assert decrypt_file(data) == b"legacy contents"
+    assert list(iter_decrypted(io.BytesIO(data))) == [b"legacy contents"]
+
+
+def test_tampered_frame_is_rejected():
+    data = bytearray(framed([b"secret"]))
+    data[-1] ^= 1
+    with pytest.raises(InvalidToken):
+        decrypt_file(bytes(data))
@@ -0,0 +1,38 @@
+import pytest
+
+import llm
+import prompts
+from prompts import TRUNCATION_MARK, fit
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    # 10 tokens: room for 40 characters, 20 of them taken by the mark.
+    monkeypatch.setitem(prompts.PROMPT_SECTION_TOKENS, "question", 10)
+    return 10
+
+
+def test_text_within_budget_is_unchanged(budget):
+    text = "x" * (budget * llm.CHARS_PER_TOKEN)
+    assert fit("question", text) == text
+
+
+def test_text_over_budget_is_cut_to_it_and_marked(budget):
+    result = fit("question", "x" * 1000)
+    assert result == "x" * (budget * llm.CHARS_PER_TOKEN - len(TRUNCATION_MARK)) + TRUNCATION_MARK
+    assert llm.estimate_tokens(result) <= budget
+
+
+def test_cut_falls_back_to_a_word_boundary(budget):
+    text = "alpha beta gamma delta epsilon zeta eta theta"
+    assert fit("question", text) == "alpha beta gamma" + TRUNCATION_MARK
+    assert fit("question", text.replace(" ", "\n", 1)) == "alpha\nbeta gamma" + TRUNCATION_MARK
+
+
+def test_boundary_in_the_first_half_is_ignored(budget):
+    assert fit("question", "a " + "x" * 100) == "a " + "x" * 18 + TRUNCATION_MARK
+
+
+def test_unknown_section_raises():
+    with pytest.raises(ValueError, match="Unknown prompt section 'nope'"):
+        fit("nope", "text")
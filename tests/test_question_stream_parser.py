@@ -0,0 +1,28 @@
+from main import QuestionStreamParser
+
+
+def test_questions_split_across_chunks():
+    parser = QuestionStreamParser()
+    assert parser.feed("Here are your questions:\n1. What is a clo") == []
+    assert parser.feed("sure?\n2. Explain ") == ["What is a closure?"]
+    assert parser.feed("the GIL.\n") == ["Explain the GIL."]
+    assert parser.questions == ["What is a closure?", "Explain the GIL."]
+
+
+def test_finish_parses_the_last_line_without_newline():
+    parser = QuestionStreamParser()
+    assert parser.feed("1. First?\n2. Second?") == ["First?"]
+    assert parser.finish() == ["Second?"]
+    assert parser.finish() == []
+
+
+def test_unnumbered_empty_and_repeated_lines_are_skipped():
+    parser = QuestionStreamParser()
+    text = "Intro\n\n  3.  Spaced out?  \n4.\n5. Spaced out?\n- Not numbered\n"
+    assert parser.feed(text) == ["Spaced out?"]
+
+
+def test_stops_at_the_limit():
+    parser = QuestionStreamParser(limit=2)
+    assert parser.feed("".join(f"{i}. Question {i}?\n" for i in range(1, 5))) == ["Question 1?", "Question 2?"]
+    assert parser.finish() == []
@@ -0,0 +1,46 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import main
+from main import RefreshTokenPayload
+
+pytestmark = pytest.mark.anyio
+
+
+async def refresh(refresh_token: str) -> dict:
+    return await main.refresh_access_token(RefreshTokenPayload(refresh_token=refresh_token))
+
+
+async def test_refresh_rotates_the_token(mongo):
+    first = await main.issue_tokens(str(ObjectId()), "a@example.com")
+
+    second = await refresh(first["refresh_token"])
+    assert second["refresh_token"] != first["refresh_token"]
+    assert second["access_token"]
+
+    third = await refresh(second["refresh_token"])
+    assert third["refresh_token"] not in (first["refresh_token"], second["refresh_token"])
+
+
+async def test_unknown_token_is_rejected(mongo):
+    with pytest.raises(HTTPException) as error:
+        await refresh("not-a-token")
+    assert error.value.status_code == 401
+
+
+async def test_reuse_revokes_the_whole_family(mongo):
+    user_id = str(ObjectId())
+    first = await main.issue_tokens(user_id, "a@example.com")
+    other_login = await main.issue_tokens(user_id, "a@example.com")
+    second = await refresh(first["refresh_token"])
+
+    # The rotated token is presented again: it has leaked.
+    with pytest.raises(HTTPException) as error:
+        await refresh(first["refresh_token"])
+    assert error.value.status_code == 401
+    # So is the token it was exchanged for...
+    with pytest.raises(HTTPException):
+        await refresh(second["refresh_token"])
+    # ...but not the sessions of other logins.
+    assert (await refresh(other_login["refresh_token"]))["refresh_token"]
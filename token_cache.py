@@ -0,0 +1,56 @@
+"""Bounded cache of access tokens that have already been verified.
+
+Frontends poll the API with the same bearer token many times over its
+lifetime. Once a token's signature and expiry have been checked, its subject is
+kept here, keyed by the SHA-256 digest of the token (the raw token is never
+stored), until the token's own ``exp``. Entries can never outlive the token.
+"""
+import hashlib
+import os
+import time
+from typing import Optional
+
+import metrics
+from lru import ExpiringLRU
+
+# 0 disables the cache.
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get("TOKEN_CACHE_MAX_SIZE", 10000))
+
+
+class TokenCache:
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        # sha256(token) -> subject, expiring at the token's exp.
+        self._entries = ExpiringLRU(
+            max_size, clock=time.time, size_gauge=metrics.gauge("token_cache_size", "Verified tokens currently cached")
+        )
+        self._hits = metrics.counter("token_cache_hits_total", "Bearer tokens accepted without re-verifying the JWT")
+        self._misses = metrics.counter("token_cache_misses_total", "Bearer tokens verified with the JWT backend")
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[str]:
+        """The subject of ``token`` if it was verified before and has not expired."""
+        if self.max_size <= 0:
+            return None
+        subject = self._entries.get(self._key(token))
+        if subject is None:
+            self._misses.inc()
+            return None
+        self._hits.inc()
+        return subject
+
+    def set(self, token: str, subject: str, exp):
+        """Remember a verified token until its ``exp`` claim (seconds since the epoch)."""
+        # Tokens without an expiry are verified every time.
+        if self.max_size <= 0 or not isinstance(exp, (int, float)):
+            return
+        self._entries.set(self._key(token), subject, exp)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache()
@@ -0,0 +1,112 @@
+"""In-process LRU + TTL cache of user documents for get_current_user.
+
+Every authenticated request resolves its JWT subject to a user document. Users
+almost never change, so each worker keeps recently seen users in memory for up
+to USER_CACHE_TTL_SECONDS. Writes to the users collection must call
+invalidate() (crud.create_user and async_crud.create_user do).
+
+The TTL bounds how stale another worker's copy can get. With
+USER_CACHE_CHANGE_STREAM=true each worker also watches the users collection and
+drops changed users immediately; this needs a replica set or sharded cluster.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from pymongo.errors import OperationFailure
+
+import metrics
+from lru import ExpiringLRU
+
+USER_CACHE_MAX_SIZE = int(os.environ.get("USER_CACHE_MAX_SIZE", 10000))
+# 0 disables the cache.
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_CHANGE_STREAM = os.environ.get("USER_CACHE_CHANGE_STREAM", "false").lower() == "true"
+USER_CACHE_CHANGE_STREAM_RETRY_SECONDS = 5
+
+
+class UserCache:
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        # str(_id) -> username, for change-stream events that only carry the id.
+        self._usernames = {}
+        # username -> user.
+        self._entries = ExpiringLRU(
+            max_size,
+            size_gauge=metrics.gauge("user_cache_size", "Users currently cached"),
+            on_remove=lambda username, user: self._usernames.pop(str(user.get("_id")), None),
+        )
+        self._hits = metrics.counter("user_cache_hits_total", "get_current_user lookups served from the cache")
+        self._misses = metrics.counter("user_cache_misses_total", "get_current_user lookups that went to MongoDB")
+        self._invalidations = metrics.counter("user_cache_invalidations_total", "Users dropped from the cache after a write")
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, username: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        user = self._entries.get(username)
+        if user is None:
+            self._misses.inc()
+            return None
+        self._hits.inc()
+        # Callers get their own copy to mutate.
+        return dict(user)
+
+    def set(self, username: str, user: dict):
+        if not self.enabled:
+            return
+        self._entries.set(username, dict(user), time.monotonic() + self.ttl)
+        self._usernames[str(user.get("_id"))] = username
+
+    def invalidate(self, username: str):
+        if self._entries.pop(username) is not None:
+            self._invalidations.inc()
+
+    def invalidate_id(self, user_id):
+        username = self._usernames.get(str(user_id))
+        if username is not None:
+            self.invalidate(username)
+
+    def clear(self):
+        self._entries.clear()
+        self._usernames.clear()
+
+
+user_cache = UserCache()
+
+
+async def watch_user_changes(cache: UserCache = user_cache):
+    """Invalidate users changed by any process, until cancelled."""
+    from database import get_async_user_collection
+
+    resume_token = None
+    while True:
+        try:
+            async with get_async_user_collection().watch(
+                full_document="updateLookup", resume_after=resume_token
+            ) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    if "documentKey" in change:
+                        cache.invalidate_id(change["documentKey"]["_id"])
+                    if change.get("fullDocument"):
+                        cache.invalidate(change["fullDocument"].get("username"))
+                    if change["operationType"] in ("drop", "rename", "dropDatabase", "invalidate"):
+                        cache.clear()
+                        resume_token = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, OperationFailure) and e.code == 40573:  # "only supported on replica sets"
+                print("WARNING: USER_CACHE_CHANGE_STREAM needs a replica set; relying on the TTL only.")
+                return
+            # Events may have been missed while the stream was down.
+            print(f"WARNING: user cache change stream failed, retrying in {USER_CACHE_CHANGE_STREAM_RETRY_SECONDS}s: {e}")
+            cache.clear()
+            resume_token = None
+            await asyncio.sleep(USER_CACHE_CHANGE_STREAM_RETRY_SECONDS)